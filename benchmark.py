@@ -0,0 +1,249 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+import mymatch1 as game
+
+# Benchmarks for the board functions and the bot.
+#   python benchmark.py --sizes 8 16 32 --output bench.json
+#   python benchmark.py --compare bench.json
+# Every run uses fixed seeds and fixed board fixtures, so two runs of the same code
+# measure the same work.
+
+DEFAULT_SIZES = [8, 16, 32]
+DEFAULT_SEED = 1234
+DEFAULT_THRESHOLD = 0.15  # 15% slower than the baseline counts as a regression
+BATCH_BOARDS = 256  # games per BatchEnv in the batch_env_step benchmark
+
+def set_grid_size(n):
+    game.grid_size = n
+
+def fixture_random(n, rng):
+    # A normal starting board: no matches and at least one legal swap
+    return game.create_stable_board(rng)
+
+def fixture_dense(n, rng):
+    # 3x3 blocks of one color: runs everywhere
+    k = len(game.tile_types)
+    return [[game.tile_types[(x//3 + y//3) % k] for x in range(n)] for y in range(n)]
+
+def fixture_deadlocked(n, rng):
+    # Repeating diagonal pattern with no matches and no legal swap
+    return [[game.tile_types[(x + 2*y) % 4] for x in range(n)] for y in range(n)]
+
+def fixture_special_heavy(n, rng):
+    # A third of the tiles are striped tiles or color bombs
+    board = fixture_random(n, rng)
+    kinds = [game.STRIPED_H, game.STRIPED_V, game.COLOR_BOMB]
+    for y in range(n):
+        for x in range(n):
+            if rng.random() < 1/3:
+                board[y][x] = (board[y][x], rng.choice(kinds))
+    return board
+
+FIXTURES = {
+    'random': fixture_random,
+    'dense': fixture_dense,
+    'deadlocked': fixture_deadlocked,
+    'special_heavy': fixture_special_heavy,
+}
+
+def copies(board, count):
+    return [[row[:] for row in board] for _ in range(count)]
+
+def cleared(board):
+    board = [row[:] for row in board]
+    game.clear_matches(board, game.find_matches_with_lengths(board))
+    return board
+
+def dropped(board):
+    board = cleared(board)
+    game.drop_tiles(board)
+    return board
+
+def legal_moves(board):
+    return game.legal_moves(board) or game.candidate_moves()[:1]
+
+# Each benchmark is (name, fixtures, make_calls). make_calls(board, count) returns a
+# list of zero-argument callables; only the calls are timed, not building them.
+def bench_create_board(board, count):
+    return [game.create_board] * count
+
+def bench_create_stable_board(board, count):
+    return [game.create_stable_board] * count
+
+def bench_find_matches(board, count):
+    return [lambda: game.find_matches_with_lengths(board)] * count
+
+def bench_clear_matches(board, count):
+    matches = game.find_matches_with_lengths(board)
+    return [lambda b=b: game.clear_matches(b, matches) for b in copies(board, count)]
+
+def bench_drop_tiles(board, count):
+    return [lambda b=b: game.drop_tiles(b) for b in copies(cleared(board), count)]
+
+def bench_refill_board(board, count):
+    return [lambda b=b: game.refill_board(b) for b in copies(dropped(board), count)]
+
+def bench_has_possible_moves(board, count):
+    return [lambda: game.has_possible_moves(board)] * count
+
+def bench_legal_moves(board, count):
+    return [lambda: game.legal_moves(board)] * count
+
+def bench_bitboard_find_matches(board, count):
+    bits = game.BitBoard(board)
+    return [bits.find_matches] * count
+
+def bench_simulate_move(board, count):
+    moves = legal_moves(board)
+    return [lambda move=moves[i % len(moves)]: game.simulate_move_and_score(board, *move) for i in range(count)]
+
+def bench_score_moves(board, count):
+    # The bot's inner loop: every legal swap of the board scored at once
+    moves = legal_moves(board)
+    return [lambda: game.score_moves(board, moves)] * count
+
+def bench_bot_move(board, count):
+    return [lambda: game.choose_bot_move(board)] * count
+
+def bench_batch_env_step(board, count):
+    # One step of BATCH_BOARDS games at once, each playing its first legal swap
+    env = game.BatchEnv(BATCH_BOARDS, len(board), seed=DEFAULT_SEED)
+    def step():
+        colors, rewards, done, legal = env.step(env.legal.argmax(axis=1))
+        env.reset(done)
+    return [step] * count
+
+BENCHMARKS = [
+    ('create_board', ['random'], bench_create_board),
+    ('create_stable_board', ['random'], bench_create_stable_board),
+    ('find_matches_with_lengths', ['random', 'dense', 'special_heavy'], bench_find_matches),
+    ('clear_matches', ['dense'], bench_clear_matches),
+    ('drop_tiles', ['dense'], bench_drop_tiles),
+    ('refill_board', ['dense'], bench_refill_board),
+    ('has_possible_moves', ['random', 'deadlocked', 'special_heavy'], bench_has_possible_moves),
+    ('legal_moves', ['random', 'deadlocked', 'special_heavy'], bench_legal_moves),
+    ('bitboard_find_matches', ['random', 'dense', 'special_heavy'], bench_bitboard_find_matches),
+    ('simulate_move_and_score', ['random', 'special_heavy'], bench_simulate_move),
+    ('score_moves', ['random', 'special_heavy'], bench_score_moves),
+    ('bot_move', ['random', 'deadlocked'], bench_bot_move),
+]
+if game.NUMPY_AVAILABLE:
+    BENCHMARKS.append(('batch_env_step', ['random'], bench_batch_env_step))
+
+def time_calls(calls):
+    start = time.perf_counter()
+    for call in calls:
+        call()
+    return time.perf_counter() - start
+
+def run_benchmark(make_calls, board, seed, repeat, min_time):
+    # Find a call count that takes about min_time, then time `repeat` rounds of it
+    count = 1
+    while True:
+        random.seed(seed)
+        elapsed = time_calls(make_calls(board, count))
+        if elapsed >= min_time or count >= 1000000:
+            break
+        count *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    per_call = []
+    for _ in range(repeat):
+        calls = make_calls(board, count)
+        random.seed(seed)
+        per_call.append(time_calls(calls) / count)
+    median = statistics.median(per_call)
+    return {
+        'calls': count,
+        'median_us': median * 1e6,
+        'min_us': min(per_call) * 1e6,
+        'mean_us': statistics.mean(per_call) * 1e6,
+        'ops_per_sec': 1 / median if median else float('inf'),
+    }
+
+def run_suite(sizes, seed, repeat, min_time, only=None):
+    results = []
+    old_size = game.grid_size
+    try:
+        for n in sizes:
+            set_grid_size(n)
+            for name, fixtures, make_calls in BENCHMARKS:
+                if only and name not in only:
+                    continue
+                for fixture in fixtures:
+                    board = FIXTURES[fixture](n, random.Random(seed))
+                    result = {'name': name, 'fixture': fixture, 'grid_size': n}
+                    result.update(run_benchmark(make_calls, board, seed, repeat, min_time))
+                    results.append(result)
+                    print(f"{name:26} {fixture:14} {n:4}x{n:<4} {result['median_us']:12.1f} us/call {result['ops_per_sec']:12.1f} calls/s", file=sys.stderr)
+    finally:
+        set_grid_size(old_size)
+    return results
+
+def result_key(result):
+    return (result['name'], result['fixture'], result['grid_size'])
+
+def compare(results, baseline, threshold):
+    # Returns the results that got slower than the baseline by more than threshold
+    base = {result_key(r): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = base.get(result_key(result))
+        if old is None:
+            continue
+        ratio = result['median_us'] / old['median_us'] if old['median_us'] else 1.0
+        result['baseline_us'] = old['median_us']
+        result['ratio'] = ratio
+        if ratio > 1 + threshold:
+            regressions.append(result)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the match 3 board functions and the bot")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="grid sizes to run")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="seed for fixtures and random draws")
+    parser.add_argument('--repeat', type=int, default=5, help="timed rounds per benchmark")
+    parser.add_argument('--min-time', type=float, default=0.1, help="seconds per timed round")
+    parser.add_argument('--only', nargs='+', help="run only these benchmarks")
+    parser.add_argument('--no-numpy', action='store_true', help="benchmark the list engine even if NumPy is installed")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--compare', metavar='BASELINE', help="flag regressions against a saved JSON report")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown before a result counts as a regression")
+    args = parser.parse_args()
+    if args.no_numpy:
+        game.USE_NUMPY = False
+    results = run_suite(args.sizes, args.seed, args.repeat, args.min_time, args.only)
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': game.USE_NUMPY,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'sizes': args.sizes,
+        },
+        'results': results,
+    }
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        report['regressions'] = [result_key(r) for r in regressions]
+        for r in regressions:
+            print(f"REGRESSION {r['name']} {r['fixture']} {r['grid_size']}x{r['grid_size']}: {r['baseline_us']:.1f} -> {r['median_us']:.1f} us/call ({r['ratio']:.2f}x)", file=sys.stderr)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,30 +1,69 @@
+import argparse
+import json
+import os
 import random
-import tkinter as tk
-from tkinter import messagebox, simpledialog
-from functools import partial
+import struct
+import time
+from functools import wraps
 import threading
+import queue
+from collections import deque
+import multiprocessing
+from multiprocessing import shared_memory
 try:
     import winsound
     SOUND_AVAILABLE = True
 except ImportError:
     SOUND_AVAILABLE = False
+# Only the game window needs Tk; the engine, the bots, --simulate and --replay run
+# on Pythons built without it
+try:
+    import tkinter as tk
+    from tkinter import messagebox
+    TK_AVAILABLE = True
+except ImportError:
+    TK_AVAILABLE = False
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
 
 # Constants
+# Defaults for a new game; the grid size, tile set and tile size can be set per game
 grid_size = 8
 tile_types = ['A', 'B', 'C', 'D', 'E']
+# Every tile a game can use, in code order; a tile set is a selection of these
 tile_colors = {
     'A': 'red',
     'B': 'blue',
     'C': 'green',
     'D': 'yellow',
     'E': 'purple',
+    'F': 'brown',
+    'G': 'pink',
+    'H': 'turquoise',
 }
+TILE_NAMES = list(tile_colors)
 HIGHLIGHT_COLOR = 'white'
+HINT_COLOR = 'cyan'
 SCORE_POP_COLOR = 'orange'
 SCORE_NORMAL_COLOR = 'black'
 
 LEVEL_BASE_TARGET = 30
 LEVEL_TARGET_INCREMENT = 20
+# An objective asks for randint(OBJECTIVE_MIN, OBJECTIVE_MAX) + level*OBJECTIVE_PER_LEVEL tiles
+OBJECTIVE_MIN = 12
+OBJECTIVE_MAX = 20
+OBJECTIVE_PER_LEVEL = 2
+# The tuning a game is played with; Match3Engine takes overrides for any of these
+BALANCE = {
+    'level_base_target': LEVEL_BASE_TARGET,
+    'level_target_increment': LEVEL_TARGET_INCREMENT,
+    'objective_min': OBJECTIVE_MIN,
+    'objective_max': OBJECTIVE_MAX,
+    'objective_per_level': OBJECTIVE_PER_LEVEL,
+}
 
 # Special tile types
 STRIPED_H = 'SH'  # Horizontal striped
@@ -43,15 +82,176 @@ SPECIAL_TILE_TEXT = {
     COLOR_BOMB: '*',
 }
 
+# A striped tile clears this many tiles to each side along its line: the whole line
+# on normal boards, while on big boards the chain reactions still die out
+STRIPE_REACH = 8
+
 TILE_SIZE = 48
 TILE_PAD = 4
+MIN_TILE_SIZE = 2*TILE_PAD + 8  # smallest tile that leaves room for a sprite inside the padding
+MAX_VIEWPORT = 768  # largest board view in pixels; bigger boards scroll
 ANIMATION_SPEED = 8  # pixels per frame
+TURBO_FPS = 30  # redraws per second while the bot plays in turbo mode
+
+# 5x7 pixel glyphs for the tile sprites ('#' is ink), scaled up to the tile size
+GLYPHS = {
+    'A': [" ### ", "#   #", "#   #", "#####", "#   #", "#   #", "#   #"],
+    'B': ["#### ", "#   #", "#   #", "#### ", "#   #", "#   #", "#### "],
+    'C': [" ### ", "#   #", "#    ", "#    ", "#    ", "#   #", " ### "],
+    'D': ["#### ", "#   #", "#   #", "#   #", "#   #", "#   #", "#### "],
+    'E': ["#####", "#    ", "#    ", "#### ", "#    ", "#    ", "#####"],
+    'F': ["#####", "#    ", "#    ", "#### ", "#    ", "#    ", "#    "],
+    'G': [" ### ", "#   #", "#    ", "# ###", "#   #", "#   #", " ####"],
+    'H': ["#   #", "#   #", "#   #", "#####", "#   #", "#   #", "#   #"],
+    '-': ["     ", "     ", "     ", "#####", "     ", "     ", "     "],
+    '|': ["  #  ", "  #  ", "  #  ", "  #  ", "  #  ", "  #  ", "  #  "],
+    '*': ["     ", "# # #", " ### ", "#####", " ### ", "# # #", "     "],
+}
 
 # Game modes
 game_modes = ["Objective Mode", "Endless Mode"]
 
-def create_board():
-    return [[random.choice(tile_types) for _ in range(grid_size)] for _ in range(grid_size)]
+# Replays: each game draws from its own seeded RNG, so its seed and moves are enough
+# to play it again. A log is REPLAY_HEADER, the tile set as TILE_NAMES indexes, then
+# one REPLAY_MOVE per swap or color bomb; logs can be stored back to back in a file.
+REPLAY_MAGIC = b'M3RP'
+REPLAY_VERSION = 2  # 2 added undo and redo; version 1 logs still read
+REPLAY_HEADER = struct.Struct('<4sBBBHQQI')  # magic, version, mode, tile count, size, seed, score, moves
+REPLAY_MOVE = struct.Struct('<BHH')  # kind, x, y
+REPLAY_SWAP_RIGHT = 0
+REPLAY_SWAP_DOWN = 1
+REPLAY_BOMB = 2  # plus the index of the color in the game's tile set
+REPLAY_UNDO = 254
+REPLAY_REDO = 255
+REFILL_CHUNK = 64  # refill tiles drawn at once into a column's buffer
+UNDO_LIMIT = 200  # moves a game can undo; older ones are forgotten
+
+# Bot: with BOT_ROLLOUTS > 1 each move is scored as the average of that many
+# cascade rollouts, spread over BOT_WORKERS processes (see MonteCarloBot)
+BOT_ROLLOUTS = 1
+BOT_WORKERS = os.cpu_count() or 1
+BOT_SEED = 0
+BOT_WINDOW = 16  # the bot simulates a swap on at most this many rows and columns around it
+BOT_POLL_MS = 15  # how often the Tk loop checks the bot worker for an answer
+TURBO_POLL_MS = 1  # the same in turbo mode, where moves follow each other at once
+# Expectimax bot (see ExpectimaxBot)
+BOT_TIME_BUDGET = 0.003  # seconds of search per move, a few times the greedy bot on 8x8
+BOT_MAX_DEPTH = 4  # moves looked ahead
+BOT_BEAM = 6  # moves searched deeper at each level, best first
+BOT_SAMPLES = 2  # refills sampled after each candidate move
+OBJECTIVE_WEIGHT = 1  # value per objective color tile cleared, on top of the points
+SPECIAL_WEIGHTS = {STRIPED_H: 2, STRIPED_V: 2, COLOR_BOMB: 6}  # value per special tile made
+
+# Use the NumPy board engine for the bot's simulations when NumPy is installed. It pays
+# off batched, scoring every swap of a board in one pass (score_moves); a single NumPy
+# call costs about as much as a whole list scan of an 8x8 board, so one board at a time
+# (find_matches_with_lengths, drop_tiles, refill_board, simulate_move_and_score) stays
+# on lists.
+USE_NUMPY = NUMPY_AVAILABLE
+
+# Integer codes for tiles, shared by the NumPy and bitboard engines and pack_board
+EMPTY_CODE = -1
+LINE_END_CODE = -2
+BOMB_CODE = -3  # color bombs in the planes the bot matches on
+TILE_CODES = {t: i for i, t in enumerate(TILE_NAMES)}
+SPECIAL_KIND_CODES = {STRIPED_H: 1, STRIPED_V: 2, COLOR_BOMB: 3}
+SPECIAL_KINDS_BY_CODE = {code: kind for kind, code in SPECIAL_KIND_CODES.items()}
+
+# Sound: one worker thread plays beeps from a short queue
+MATCH_SOUND = (800, 120)  # frequency in Hz, length in ms
+SOUND_QUEUE_SIZE = 2  # sounds waiting to play; more than this are dropped
+
+# Profiling: off unless --profile or the F3 overlay turns it on
+PERF_OVERLAY_MS = 250  # how often the on-screen overlay refreshes
+
+class PhaseStats:
+    # Call count, total, last and longest time of one phase, plus a histogram of the
+    # times in power of two microsecond buckets (bucket k holds times under 2**k us)
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.longest = 0.0
+        self.buckets = {}
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        self.last = seconds
+        self.longest = max(self.longest, seconds)
+        bucket = int(seconds * 1e6).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'total_ms': self.total * 1e3,
+            'mean_us': self.total / self.calls * 1e6 if self.calls else 0.0,
+            'max_ms': self.longest * 1e3,
+            'histogram_us': {f"<{2**bucket}": count for bucket, count in sorted(self.buckets.items())},
+        }
+
+class Profiler:
+    # Per-phase timings from the profiled() functions, the bot thread and the Tk timers,
+    # and how many cascade steps each move took. Does nothing while enabled is False.
+    def __init__(self):
+        self.enabled = False
+        self.phases = {}
+        self.cascade_depths = {}
+        self.lock = threading.Lock()
+
+    def record(self, phase, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            stats = self.phases.get(phase)
+            if stats is None:
+                stats = self.phases[phase] = PhaseStats()
+            stats.add(seconds)
+
+    def record_cascade(self, depth):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.cascade_depths[depth] = self.cascade_depths.get(depth, 0) + 1
+
+    def last_ms(self, phase):
+        stats = self.phases.get(phase)
+        return stats.last * 1e3 if stats else 0.0
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'phases': {name: stats.to_dict() for name, stats in sorted(self.phases.items())},
+                'cascade_depths': {str(depth): count for depth, count in sorted(self.cascade_depths.items())},
+            }
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+PROFILER = Profiler()
+
+def profiled(phase):
+    # Decorator that times every call under phase while PROFILER is enabled; when it is
+    # off the only cost is checking the flag
+    def decorate(func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                PROFILER.record(phase, time.perf_counter() - start)
+        return timed
+    return decorate
+
+def create_board(size=None, tiles=None):
+    size = size or grid_size
+    tiles = tiles or tile_types
+    return [[random.choice(tiles) for _ in range(size)] for _ in range(size)]
 
 def is_special(tile):
     return isinstance(tile, tuple)
@@ -66,13 +266,60 @@ def get_special_kind(tile):
         return tile[1]
     return None
 
+def get_match_type(tile):
+    # What a tile matches on: its color, except that color bombs never match. Inlined,
+    # since every match scan calls it once per cell.
+    if isinstance(tile, tuple):
+        return COLOR_BOMB if tile[1] == COLOR_BOMB else tile[0]
+    return tile
+
+class CowBoard(list):
+    # A board that shares its rows with the boards it was snapshotted from or to. Rows
+    # are copied on their first write through writable_row(), so a snapshot costs one
+    # list of row references and a change copies only the rows it touches.
+    def __init__(self, rows=()):
+        super().__init__(rows)
+        self.owned = set()  # rows no other board holds, safe to write in place
+
+    def snapshot(self):
+        # From now on both boards share every row
+        self.owned.clear()
+        return CowBoard(self)
+
+    def writable(self, y):
+        if y not in self.owned:
+            self[y] = self[y][:]
+            self.owned.add(y)
+        return self[y]
+
+def snapshot(board):
+    # A CowBoard sharing board's rows; board itself must not change in place while the
+    # snapshot is in use unless it is a CowBoard too
+    return board.snapshot() if isinstance(board, CowBoard) else CowBoard(board)
+
+def writable_row(board, y):
+    # Row y, ready to write into: a CowBoard copies it first if it is shared
+    return board.writable(y) if isinstance(board, CowBoard) else board[y]
+
+def swap_cells(board, x1, y1, x2, y2):
+    row1, row2 = writable_row(board, y1), writable_row(board, y2)
+    row1[x1], row2[x2] = row2[x2], row1[x1]
+
 def find_matches_with_lengths(board):
+    return find_matches_in_lines(board, range(len(board)), range(len(board[0])))
+
+@profiled('find_matches')
+def find_matches_in_lines(board, rows, cols):
+    # Same {pos: length} dict as a full scan, but only looks at the given rows and columns.
+    # On a board that had no matches, every new run crosses a row or column that changed.
+    h, w = len(board), len(board[0])
     matched = dict()
     # Horizontal matches
-    for y in range(grid_size):
+    for y in sorted(rows):
+        line = list(map(get_match_type, board[y]))
         count = 1
-        for x in range(1, grid_size):
-            if get_tile_type(board[y][x]) == get_tile_type(board[y][x-1]) and get_tile_type(board[y][x]) not in [COLOR_BOMB]:
+        for x in range(1, w):
+            if line[x] == line[x-1] and line[x] not in [COLOR_BOMB]:
                 count += 1
             else:
                 if count >= 3:
@@ -81,12 +328,13 @@ def find_matches_with_lengths(board):
                 count = 1
         if count >= 3:
             for k in range(count):
-                matched[(grid_size-1-k, y)] = count
+                matched[(w-1-k, y)] = count
     # Vertical matches
-    for x in range(grid_size):
+    for x in sorted(cols):
+        line = [get_match_type(row[x]) for row in board]
         count = 1
-        for y in range(1, grid_size):
-            if get_tile_type(board[y][x]) == get_tile_type(board[y-1][x]) and get_tile_type(board[y][x]) not in [COLOR_BOMB]:
+        for y in range(1, h):
+            if line[y] == line[y-1] and line[y] not in [COLOR_BOMB]:
                 count += 1
             else:
                 if count >= 3:
@@ -96,51 +344,198 @@ def find_matches_with_lengths(board):
                 count = 1
         if count >= 3:
             for k in range(count):
-                pos = (x, grid_size-1-k)
+                pos = (x, h-1-k)
                 matched[pos] = max(matched.get(pos, 0), count)
     return matched
 
+def find_matches_after_swap(board, x1, y1, x2, y2):
+    return find_matches_in_lines(board, {y1, y2}, {x1, x2})
+
+def find_matches_after_drop(board, dropped):
+    # dropped is what drop_tiles returned: only those columns and the rows above the
+    # deepest gap can hold a new run
+    if not dropped:
+        return {}
+    return find_matches_in_lines(board, range(max(dropped.values())), dropped)
+
+def forms_match_at(board, x, y):
+    # Short line probe: is (x, y) part of a 3+ line of its own color?
+    t = get_match_type(board[y][x])
+    if t in [COLOR_BOMB]:
+        return False
+    h, w = len(board), len(board[0])
+    left = x
+    while left > 0 and get_match_type(board[y][left-1]) == t:
+        left -= 1
+    right = x
+    while right < w-1 and get_match_type(board[y][right+1]) == t:
+        right += 1
+    if right - left >= 2:
+        return True
+    top = y
+    while top > 0 and get_match_type(board[top-1][x]) == t:
+        top -= 1
+    bottom = y
+    while bottom < h-1 and get_match_type(board[bottom+1][x]) == t:
+        bottom += 1
+    return bottom - top >= 2
+
+def swap_creates_match(board, x1, y1, x2, y2):
+    board[y1][x1], board[y2][x2] = board[y2][x2], board[y1][x1]
+    found = forms_match_at(board, x1, y1) or forms_match_at(board, x2, y2)
+    board[y1][x1], board[y2][x2] = board[y2][x2], board[y1][x1]
+    return found
+
 def clear_matches(board, matches):
     for (x, y) in matches:
-        board[y][x] = None
-
-def drop_tiles(board):
-    for x in range(grid_size):
-        col = [board[y][x] for y in range(grid_size)]
-        col = [tile for tile in col if tile is not None]
-        missing = grid_size - len(col)
-        new_col = [None]*missing + col
-        for y in range(grid_size):
-            board[y][x] = new_col[y]
-
-def refill_board(board):
-    for y in range(grid_size):
-        for x in range(grid_size):
-            if board[y][x] is None:
-                board[y][x] = random.choice(tile_types)
+        writable_row(board, y)[x] = None
+
+@profiled('drop_tiles')
+def drop_tiles(board, cols=None):
+    # Returns {x: rows changed from the top} for every column that had a gap. cols limits
+    # the work to the columns that can have one.
+    h = len(board)
+    dropped = {}
+    new_cols = []
+    for x in sorted(cols) if cols is not None else range(len(board[0])):
+        col = [row[x] for row in board]
+        if None not in col:
+            continue
+        # Tiles below the lowest gap stay where they are
+        rows = dropped[x] = h - col[::-1].index(None)
+        col = [tile for tile in col[:rows] if tile is not None]
+        new_cols.append((x, [None]*(rows - len(col)) + col))
+    # Write row by row, so a CowBoard copies each changed row once
+    for y in range(max(dropped.values(), default=0)):
+        row = writable_row(board, y)
+        for x, new_col in new_cols:
+            if y < len(new_col):
+                row[x] = new_col[y]
+    return dropped
+
+@profiled('refill')
+def refill_board(board, rng=random, tiles=None, dropped=None):
+    # dropped (from drop_tiles) limits the scan to the rows that can be empty
+    tiles = tiles or tile_types
+    if dropped is None:
+        dropped = dict.fromkeys(range(len(board[0])), len(board))
+    for y in range(max(dropped.values(), default=0)):
+        row = board[y]
+        for x in dropped:
+            if row[x] is None:
+                row = writable_row(board, y)
+                row[x] = rng.choice(tiles)
 
 def is_adjacent(x1, y1, x2, y2):
     return (abs(x1 - x2) == 1 and y1 == y2) or (abs(y1 - y2) == 1 and x1 == x2)
 
+def candidate_moves(h=None, w=None):
+    # Every adjacent swap (with the right or lower neighbour), in the bot's scan order
+    h = h or grid_size
+    w = w or h
+    moves = []
+    for y in range(h):
+        for x in range(w):
+            for dx, dy in [(1,0),(0,1)]:
+                nx, ny = x+dx, y+dy
+                if nx < w and ny < h:
+                    moves.append((x, y, nx, ny))
+    return moves
+
+def move_order(move):
+    # Sort key that puts moves in candidate_moves() order
+    return (move[1], move[0], move[3])
+
 def has_possible_moves(board):
-    for y in range(grid_size):
-        for x in range(grid_size):
+    # Expects a board without matches, like the game keeps between moves
+    h, w = len(board), len(board[0])
+    for y in range(h):
+        for x in range(w):
             for dx, dy in [(1,0),(0,1)]:
                 nx, ny = x+dx, y+dy
-                if nx < grid_size and ny < grid_size:
-                    t1, t2 = board[y][x], board[ny][nx]
-                    board[y][x], board[ny][nx] = t2, t1
-                    if find_matches_with_lengths(board):
-                        board[y][x], board[ny][nx] = t1, t2
+                if nx < w and ny < h:
+                    if swap_creates_match(board, x, y, nx, ny):
                         return True
-                    board[y][x], board[ny][nx] = t1, t2
     return False
 
-def simulate_move_and_score(board, x1, y1, x2, y2):
-    temp_board = [row[:] for row in board]
-    temp_board[y1][x1], temp_board[y2][x2] = temp_board[y2][x2], temp_board[y1][x1]
+def apply_matches(board, matches, rng=random):
+    # One cascade step short of the refill, for the engine and the bots alike: score the
+    # matches, create and fire special tiles, then drop. Returns (points, {color: tiles
+    # cleared}, [(x, y, special) created], dropped).
+    h, w = len(board), len(board[0])
+    # Special tile creation and effect
+    specials_to_create = []
+    color_counts = {}
+    for pos, length in matches.items():
+        x, y = pos
+        base = get_tile_type(board[y][x])
+        color_counts[base] = color_counts.get(base, 0) + 1
+        if length == 4:
+            # Striped tile: randomly horizontal or vertical
+            kind = rng.choice([STRIPED_H, STRIPED_V])
+            specials_to_create.append((x, y, (base, kind)))
+        elif length >= 5:
+            # Color bomb
+            specials_to_create.append((x, y, (base, COLOR_BOMB)))
+    # Scoring: 3 in a row = 1pt/tile, 4 in a row = 2pt/tile, 5+ in a row = 3pt/tile
+    points = 0
+    for pos, length in matches.items():
+        if length >= 5:
+            points += 3
+        elif length == 4:
+            points += 2
+        else:
+            points += 1
+    # Place special tiles after clearing
+    clear_matches(board, matches)
+    for x, y, special in specials_to_create:
+        writable_row(board, y)[x] = special
+    # Activate special effects if matched; cols collects the columns that lost tiles
+    cols = {x for x, y in matches}
+    for pos in matches:
+        x, y = pos
+        tile = board[y][x]
+        if is_special(tile):
+            kind = get_special_kind(tile)
+            if kind == STRIPED_H:
+                reach = range(max(0, x-STRIPE_REACH), min(w, x+STRIPE_REACH+1))
+                row = writable_row(board, y)
+                for xx in reach:
+                    row[xx] = None
+                cols.update(reach)
+            elif kind == STRIPED_V:
+                for yy in range(max(0, y-STRIPE_REACH), min(h, y+STRIPE_REACH+1)):
+                    writable_row(board, yy)[x] = None
+    dropped = drop_tiles(board, cols)
+    return points, color_counts, specials_to_create, dropped
+
+@profiled('bot_simulate')
+def simulate_turn(board, x1, y1, x2, y2, rng=random, tiles=None):
+    # A swap and its whole cascade under the engine's rules, on a snapshot of board.
+    # Returns (board after, points, {color: tiles cleared}, [special tiles created]).
+    board = snapshot(board)
+    swap_cells(board, x1, y1, x2, y2)
+    total_points = 0
+    cleared = {}
+    created = []
+    matches = find_matches_after_swap(board, x1, y1, x2, y2)
+    while matches:
+        points, color_counts, specials, dropped = apply_matches(board, matches, rng)
+        total_points += points
+        for color, count in color_counts.items():
+            cleared[color] = cleared.get(color, 0) + count
+        created.extend(special for x, y, special in specials)
+        refill_board(board, rng, tiles, dropped)
+        matches = find_matches_after_drop(board, dropped)
+    return board, total_points, cleared, created
+
+@profiled('bot_simulate')
+def simulate_move_and_score(board, x1, y1, x2, y2, rng=random, tiles=None):
+    # One board at a time stays on lists (see USE_NUMPY)
+    temp_board = snapshot(board)
+    swap_cells(temp_board, x1, y1, x2, y2)
     total_score = 0
-    matches = find_matches_with_lengths(temp_board)
+    matches = find_matches_after_swap(temp_board, x1, y1, x2, y2)
     while matches:
         for pos, length in matches.items():
             if length >= 5:
@@ -150,61 +545,1305 @@ def simulate_move_and_score(board, x1, y1, x2, y2):
             else:
                 total_score += 1
         clear_matches(temp_board, matches)
-        drop_tiles(temp_board)
-        refill_board(temp_board)
-        matches = find_matches_with_lengths(temp_board)
+        dropped = drop_tiles(temp_board, {x for x, y in matches})
+        refill_board(temp_board, rng, tiles, dropped)
+        matches = find_matches_after_drop(temp_board, dropped)
     return total_score
 
-class Match3Game:
-    def __init__(self, root):
-        self.root = root
-        self.mode = self.ask_mode()
-        self.board = create_board()
-        while find_matches_with_lengths(self.board):
-            self.board = create_board()
+class MoveIndex:
+    # Live set of swaps that make a match. sync() compares the board with the copy it saw
+    # last time and only probes again the swaps near cells whose color changed.
+    def __init__(self, board):
+        self.moves = set()
+        self.snapshot = [[None]*len(board[0]) for _ in board]
+        self.sync(board)
+
+    @profiled('legal_moves')
+    def sync(self, board):
+        h, w = len(board), len(board[0])
+        if len(self.snapshot) != h or len(self.snapshot[0]) != w:
+            self.moves = set()
+            self.snapshot = [[None]*w for _ in range(h)]
+        changed = []
+        for y in range(h):
+            old_row, row = self.snapshot[y], board[y]
+            if old_row == row:
+                continue
+            for x in range(w):
+                if get_match_type(row[x]) != get_match_type(old_row[x]):
+                    changed.append((x, y))
+            # Keep the whole row, special kinds included, so the row is skipped until it changes again
+            self.snapshot[y] = row[:]
+        if not changed:
+            return
+        if len(changed) > h*w // 4:
+            # Most of the board is new: list the legal swaps from bitboards in one go
+            self.moves = set(legal_moves(board))
+            return
+        # Whether a swap makes a match depends on the cells up to two steps along the
+        # row and column of either swapped cell, so those are the swaps to probe again
+        near = set()
+        for x, y in changed:
+            for d in range(-2, 3):
+                if 0 <= x+d < w:
+                    near.add((x+d, y))
+                if 0 <= y+d < h:
+                    near.add((x, y+d))
+        for x, y in near:
+            for move in [(x, y, x+1, y), (x, y, x, y+1), (x-1, y, x, y), (x, y-1, x, y)]:
+                x1, y1, x2, y2 = move
+                if x1 < 0 or y1 < 0 or x2 >= w or y2 >= h:
+                    continue
+                if swap_creates_match(board, *move):
+                    self.moves.add(move)
+                else:
+                    self.moves.discard(move)
+
+    def hint(self):
+        # First legal move in scan order, or None when the board is deadlocked
+        if not self.moves:
+            return None
+        return min(self.moves, key=move_order)
+
+    def ordered(self):
+        # The legal moves in candidate_moves() order, for the bots
+        return sorted(self.moves, key=move_order)
+
+# NumPy board engine
+# A board is an (h, w) int8 array of the colors the matcher sees: an index into
+# TILE_NAMES, EMPTY_CODE for a cleared cell and BOMB_CODE for a color bomb. Special
+# kinds are left out, as the bot's simulations only score points. The functions below
+# accept extra leading axes, so a stack of boards can be processed in one call.
+
+def _tile_code_tables():
+    color_codes = {None: EMPTY_CODE}
+    kind_codes = {None: 0}
+    for t in TILE_NAMES:
+        color_codes[t] = TILE_CODES[t]
+        kind_codes[t] = 0
+        for kind, code in SPECIAL_KIND_CODES.items():
+            color_codes[(t, kind)] = TILE_CODES[t]
+            kind_codes[(t, kind)] = code
+    return color_codes, kind_codes
+
+COLOR_CODE_OF, KIND_CODE_OF = _tile_code_tables()
+MATCH_CODE_OF = {tile: BOMB_CODE if get_special_kind(tile) == COLOR_BOMB else code for tile, code in COLOR_CODE_OF.items()}
+
+def encode_colors(board):
+    # The colors the matcher sees, with BOMB_CODE for color bombs
+    h, w = len(board), len(board[0])
+    return np.fromiter((MATCH_CODE_OF[tile] for row in board for tile in row), np.int8, h*w).reshape(h, w)
+
+def _padded_runs(colors):
+    # Lay the lines out end to end with a separator cell after each one, so the runs of
+    # every line (and every board in a stack) come out of a single diff
+    padded = np.full(colors.shape[:-1] + (colors.shape[-1]+1,), LINE_END_CODE, dtype=np.int8)
+    padded[..., :-1] = colors
+    flat = padded.ravel()
+    starts = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    lengths = np.diff(np.concatenate(([0], starts, [flat.size])))
+    return padded.shape, starts, lengths
+
+def _run_lengths(colors):
+    # Length of the run of equal colors each cell belongs to, along the last axis
+    shape, _, lengths = _padded_runs(colors)
+    return np.repeat(lengths, lengths).reshape(shape)[..., :-1]
+
+def match_lengths_np(colors):
+    # Length of the longest 3+ run through each cell, 0 for unmatched cells
+    h_len = _run_lengths(colors)
+    v_len = np.swapaxes(_run_lengths(np.swapaxes(colors, -1, -2)), -1, -2)
+    h_len[h_len < 3] = 0
+    v_len[v_len < 3] = 0
+    lengths = np.maximum(h_len, v_len)
+    lengths[colors == BOMB_CODE] = 0
+    return lengths
+
+def drop_tiles_np(colors):
+    # Stable sort of every column with empty cells first keeps the fall order
+    order = np.argsort(colors != EMPTY_CODE, axis=-2, kind='stable')
+    colors[...] = np.take_along_axis(colors, order, axis=-2)
+
+def tile_codes(tiles=None):
+    return [TILE_CODES[t] for t in tiles or tile_types]
+
+def resolve_cascades_np(stack, rng, tiles=None):
+    # Runs the cascades of a whole (boards, h, w) stack together, in place, and returns
+    # each board's score. Boards drop out of the loop once they have no matches left.
+    scores = np.zeros(len(stack), dtype=np.int64)
+    active = np.arange(len(stack))
+    codes = np.array(tile_codes(tiles), dtype=np.int8)
+    while len(active):
+        colors = stack[active]
+        lengths = match_lengths_np(colors)
+        matched = lengths > 0
+        has_matches = matched.any(axis=(1, 2))
+        if not has_matches.all():
+            active, colors = active[has_matches], colors[has_matches]
+            lengths, matched = lengths[has_matches], matched[has_matches]
+            if not len(active):
+                break
+        # 3 in a row = 1pt/tile, 4 in a row = 2pt/tile, 5+ in a row = 3pt/tile
+        scores[active] += np.where(matched, np.minimum(lengths - 2, 3), 0).sum(axis=(1, 2))
+        colors[matched] = EMPTY_CODE
+        drop_tiles_np(colors)
+        empty = colors == EMPTY_CODE
+        colors[empty] = rng.choice(codes, size=int(empty.sum()))
+        stack[active] = colors
+    return scores
+
+def score_moves_np(colors, moves, tiles=None):
+    # One board copy (or move_window() cut) per move with the swap applied, then all
+    # cascades at once
+    moves = np.asarray(moves).reshape(-1, 4)
+    h, w = colors.shape
+    if h <= BOT_WINDOW and w <= BOT_WINDOW:
+        stack = np.repeat(colors[np.newaxis], len(moves), axis=0)
+    else:
+        origins = np.array([window_origin(h, w, *move) for move in moves.tolist()]).reshape(-1, 2)
+        rows = origins[:, 1, np.newaxis] + np.arange(min(h, BOT_WINDOW))
+        cols = origins[:, 0, np.newaxis] + np.arange(min(w, BOT_WINDOW))
+        stack = colors[rows[:, :, np.newaxis], cols[:, np.newaxis, :]]
+        moves = moves - origins[:, [0, 1, 0, 1]]
+    idx = np.arange(len(moves))
+    x1, y1, x2, y2 = moves.T
+    stack[idx, y1, x1], stack[idx, y2, x2] = stack[idx, y2, x2], stack[idx, y1, x1]
+    # Seeded from the random module so random.seed() still makes the bot repeatable
+    rng = np.random.default_rng(random.getrandbits(64))
+    return resolve_cascades_np(stack, rng, tiles)
+
+def swap_right_legal_np(colors):
+    # (..., h, w) bools: does swapping each cell with its right neighbour make a match?
+    # Checks the patterns around both cells after the swap on a copy padded with
+    # LINE_END_CODE, so every neighbour lookup is a shifted view of it.
+    h, w = colors.shape[-2:]
+    padded = np.full(colors.shape[:-2] + (h+4, w+5), LINE_END_CODE, dtype=np.int8)
+    padded[..., 2:h+2, 2:w+2] = colors
+    def at(dy, dx):
+        return padded[..., 2+dy:2+dy+h, 2+dx:2+dx+w]
+    def forms(c, x, away):
+        # Does color c at column offset x make a 3-run? away is the step along the row
+        # that leads away from the other swapped cell.
+        up, down = at(-1, x) == c, at(1, x) == c
+        vertical = (up & down) | (up & (at(-2, x) == c)) | (down & (at(2, x) == c))
+        return vertical | ((at(0, x+away) == c) & (at(0, x+2*away) == c))
+    left, right = at(0, 0), at(0, 1)
+    # Empty cells, color bombs and the padding are all negative and never match
+    return ((right >= 0) & forms(right, 0, -1)) | ((left >= 0) & forms(left, 1, 1))
+
+class BatchEnv:
+    # N games stepped together for training and evaluating bots. The boards are one
+    # (N, h, w) int8 array of color codes, and an action is an index into
+    # candidate_moves(h, w). step() plays one swap per board and runs every cascade
+    # together; a swap that makes no match is undone. Rewards use the game's per-tile
+    # scoring, but there are no special tiles, objectives or level-ups. A board is done
+    # once it has no legal swap left; reset() deals new boards.
+    def __init__(self, n, size=None, tiles=None, seed=None):
+        self.n = n
+        self.size = size or grid_size
+        self.codes = np.array(tile_codes(tiles), dtype=np.int8)
+        self.tiles = tiles
+        self.rng = np.random.default_rng(seed if seed is not None else random.getrandbits(64))
+        self.moves = np.array(candidate_moves(self.size, self.size), dtype=np.intp)
+        # Position of each candidate move in the flattened (h, w, right/down) legality array
+        x1, y1, x2, y2 = self.moves.T
+        self.move_slots = (y1*self.size + x1)*2 + (y2 > y1)
+        self.colors = np.empty((n, self.size, self.size), dtype=np.int8)
+        self.legal = np.zeros((n, len(self.moves)), dtype=bool)
+        self.scores = np.zeros(n, dtype=np.int64)
+        self.reset()
+
+    def legal_mask(self, colors):
+        # (boards, moves) legal-move mask of a stack of boards
+        right = swap_right_legal_np(colors)
+        down = np.swapaxes(swap_right_legal_np(np.swapaxes(colors, -1, -2)), -1, -2)
+        return np.stack([right, down], axis=-1).reshape(len(colors), -1)[:, self.move_slots]
+
+    def deal(self, count):
+        # count starting boards: no matches and at least one legal swap
+        colors = self.rng.choice(self.codes, size=(count, self.size, self.size))
+        pending = np.arange(count)
+        while len(pending):
+            stack = colors[pending]
+            matched = match_lengths_np(stack) > 0
+            stack[matched] = self.rng.choice(self.codes, size=int(matched.sum()))
+            stuck = ~matched.any(axis=(1, 2)) & ~self.legal_mask(stack).any(axis=1)
+            stack[stuck] = self.rng.choice(self.codes, size=(int(stuck.sum()), self.size, self.size))
+            colors[pending] = stack
+            pending = pending[matched.any(axis=(1, 2)) | stuck]
+        return colors
+
+    def reset(self, mask=None):
+        # Deals new boards everywhere, or where mask is True. Returns (boards, legal mask).
+        index = np.arange(self.n) if mask is None else np.flatnonzero(mask)
+        if len(index):
+            self.colors[index] = self.deal(len(index))
+            self.legal[index] = self.legal_mask(self.colors[index])
+            self.scores[index] = 0
+        return self.colors, self.legal
+
+    def step(self, actions):
+        # Plays actions[i] on board i. Returns (boards, rewards, done flags, legal mask);
+        # the arrays are the environment's own and change on the next call.
+        actions = np.asarray(actions, dtype=np.intp)
+        rewards = np.zeros(self.n, dtype=np.int64)
+        index = np.flatnonzero(self.legal[np.arange(self.n), actions])
+        if len(index):
+            x1, y1, x2, y2 = self.moves[actions[index]].T
+            stack = self.colors[index]
+            boards = np.arange(len(index))
+            stack[boards, y1, x1], stack[boards, y2, x2] = stack[boards, y2, x2], stack[boards, y1, x1]
+            rewards[index] = resolve_cascades_np(stack, self.rng, self.tiles)
+            self.colors[index] = stack
+            self.legal[index] = self.legal_mask(stack)
+            self.scores += rewards
+        done = ~self.legal.any(axis=1)
+        return self.colors, rewards, done, self.legal
+
+@profiled('bot_score_moves')
+def score_moves(board, moves=None, tiles=None):
+    # Simulated score of every move, indexed like moves (candidate_moves() by default)
+    if moves is None:
+        moves = candidate_moves(len(board), len(board[0]))
+    if USE_NUMPY and moves:
+        return score_moves_np(encode_colors(board), moves, tiles).tolist()
+    if len(board) <= BOT_WINDOW and len(board[0]) <= BOT_WINDOW:
+        return [simulate_move_and_score(board, *move, tiles=tiles) for move in moves]
+    return [simulate_move_and_score(*move_window(board, move), tiles=tiles) for move in moves]
+
+def window_origin(h, w, x1, y1, x2, y2):
+    # Top left corner of the BOT_WINDOW square centered on a swap, kept on the board
+    x0 = max(0, min(w - BOT_WINDOW, min(x1, x2) - (BOT_WINDOW-1)//2))
+    y0 = max(0, min(h - BOT_WINDOW, min(y1, y2) - (BOT_WINDOW-1)//2))
+    return x0, y0
+
+def move_window(board, move):
+    # The cut of a big board the bot simulates a swap on, and the swap in its coordinates.
+    # A cascade mostly stays near the swap and the refills are random anyway, so the
+    # score hardly changes, but the cost no longer grows with the board.
+    x1, y1, x2, y2 = move
+    x0, y0 = window_origin(len(board), len(board[0]), *move)
+    window = [row[x0:x0+BOT_WINDOW] for row in board[y0:y0+BOT_WINDOW]]
+    return window, x1-x0, y1-y0, x2-x0, y2-y0
+
+def pick_best_move(moves, scores):
+    # Highest scoring move, the first one in scan order on ties
+    best_score = -1
+    best_move = None
+    for move, score in zip(moves, scores):
+        if score > best_score:
+            best_score = score
+            best_move = move
+    return best_move
+
+def bot_moves(board, moves=None):
+    # The moves a bot weighs: the legal ones (from the game's MoveIndex when it passes
+    # them), or the first swap on a deadlocked board
+    if moves is None:
+        moves = legal_moves(board)
+    return moves or candidate_moves(len(board), len(board[0]))[:1]
+
+def choose_bot_move(board, moves=None, tiles=None):
+    # Only swaps that make a match can score, so only those are simulated
+    moves = bot_moves(board, moves)
+    return pick_best_move(moves, score_moves(board, moves, tiles))
+
+# Bitboard engine
+# One Python int per color: bit y*stride + x is set where that color sits. The stride
+# leaves a zero column after every row so horizontal shifts never wrap into the next
+# row, and Python ints grow as needed, so any grid size works. Empty cells are a color
+# of their own, like EMPTY_CODE in the NumPy engine, and specials get one mask per kind.
+
+_swap_masks = {}
+
+def swap_masks(h, w):
+    # Masks of the cells that have a right and a lower neighbour
+    if (h, w) not in _swap_masks:
+        s = w + 1
+        right_mask = down_mask = 0
+        for y in range(h):
+            for x in range(w):
+                if x < w-1:
+                    right_mask |= 1 << (y*s + x)
+                if y < h-1:
+                    down_mask |= 1 << (y*s + x)
+        _swap_masks[(h, w)] = right_mask, down_mask
+    return _swap_masks[(h, w)]
+
+def _matches_from_runs(h_runs, v_runs):
+    # Build the {pos: length} dict in the same order find_matches_with_lengths does,
+    # from (y, x_start, length) horizontal runs and (x, y_start, length) vertical runs
+    matched = dict()
+    for y, x0, count in h_runs:
+        for k in range(count):
+            matched[(x0+count-1-k, y)] = count
+    for x, y0, count in v_runs:
+        for k in range(count):
+            pos = (x, y0+count-1-k)
+            matched[pos] = max(matched.get(pos, 0), count)
+    return matched
+
+def bit_indices(mask):
+    # Positions of the set bits, lowest first
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+class BitBoard:
+    def __init__(self, board):
+        self.h, self.w = len(board), len(board[0])
+        self.stride = self.w + 1
+        self.planes = {}
+        self.kinds = {}
+        for y, row in enumerate(board):
+            for x, tile in enumerate(row):
+                bit = 1 << (y*self.stride + x)
+                color = COLOR_CODE_OF[tile]
+                self.planes[color] = self.planes.get(color, 0) | bit
+                kind = KIND_CODE_OF[tile]
+                if kind:
+                    self.kinds[kind] = self.kinds.get(kind, 0) | bit
+        self.right_mask, self.down_mask = swap_masks(self.h, self.w)
+
+    def bombs(self):
+        return self.kinds.get(SPECIAL_KIND_CODES[COLOR_BOMB], 0)
+
+    def match_planes(self):
+        # The color planes without the color bombs, which never match
+        bombs = self.bombs()
+        return [plane & ~bombs for plane in self.planes.values()]
+
+    def covered(self, plane):
+        # Cells of plane that sit in a horizontal or a vertical 3+ run
+        s = self.stride
+        h3 = plane & plane >> 1 & plane >> 2
+        v3 = plane & plane >> s & plane >> 2*s
+        return h3 | h3 << 1 | h3 << 2, v3 | v3 << s | v3 << 2*s
+
+    def runs(self):
+        # (y, x_start, length) horizontal and (x, y_start, length) vertical 3+ runs,
+        # in the order find_matches_with_lengths scans them
+        s = self.stride
+        h_runs, v_runs = [], []
+        for plane in self.match_planes():
+            h_cover, v_cover = self.covered(plane)
+            for i in bit_indices(h_cover & ~(h_cover << 1)):
+                count = 1
+                while h_cover >> (i+count) & 1:
+                    count += 1
+                y, x = divmod(i, s)
+                h_runs.append((y, x, count))
+            for i in bit_indices(v_cover & ~(v_cover << s)):
+                count = 1
+                while v_cover >> (i+count*s) & 1:
+                    count += 1
+                y, x = divmod(i, s)
+                v_runs.append((x, y, count))
+        h_runs.sort()
+        v_runs.sort()
+        return h_runs, v_runs
+
+    def find_matches(self):
+        # Same {pos: length} dict as find_matches_with_lengths
+        return _matches_from_runs(*self.runs())
+
+    def legal_moves(self):
+        # Every swap that makes a match, in candidate_moves() order, worked out for all
+        # swaps at once: a tile arriving at p makes a run when one of the cell pairs that
+        # completes a line through p, not counting the cell it came from, has its color
+        s = self.stride
+        right_ok = down_ok = 0
+        for plane in self.match_planes():
+            left2 = plane << 1 & plane << 2
+            right2 = plane >> 1 & plane >> 2
+            up2 = plane << s & plane << 2*s
+            down2 = plane >> s & plane >> 2*s
+            h_mid = plane << 1 & plane >> 1
+            v_mid = plane << s & plane >> s
+            vertical = up2 | down2 | v_mid
+            horizontal = left2 | right2 | h_mid
+            # Horizontal swap at p: this color moves from p+1 to p, or from p to p+1
+            right_ok |= (left2 | vertical) & plane >> 1
+            right_ok |= (right2 | vertical) >> 1 & plane
+            # Vertical swap at p: this color moves from p+s to p, or from p to p+s
+            down_ok |= (up2 | horizontal) & plane >> s
+            down_ok |= (down2 | horizontal) >> s & plane
+            # Swapping two tiles of the same color only counts if one is already in a run
+            h_cover, v_cover = self.covered(plane)
+            cover = h_cover | v_cover
+            same_h = plane & plane >> 1
+            same_v = plane & plane >> s
+            right_ok = (right_ok & ~same_h) | (same_h & (cover | cover >> 1))
+            down_ok = (down_ok & ~same_v) | (same_v & (cover | cover >> s))
+        right_ok &= self.right_mask
+        down_ok &= self.down_mask
+        moves = [(i % s, i // s, i % s + 1, i // s) for i in bit_indices(right_ok)]
+        moves += [(i % s, i // s, i % s, i // s + 1) for i in bit_indices(down_ok)]
+        moves.sort(key=lambda move: (move[1], move[0], move[3]))
+        return moves
+
+def legal_moves(board):
+    # Every swap that makes a match, in candidate_moves() order
+    return BitBoard(board).legal_moves()
+
+class GreedyBot:
+    # The depth-1 bot: plays the swap whose simulated cascade scores most, like
+    # choose_bot_move
+    def __init__(self, tiles=None):
+        self.tiles = tiles
+
+    def choose_move(self, board, moves=None, objective=None):
+        return choose_bot_move(board, moves, self.tiles)
+
+    def close(self):
+        pass
+
+def pack_board(board):
+    # Compact byte form of a board: the color codes, then the special kind codes
+    colors = bytes(COLOR_CODE_OF[tile] & 0xFF for row in board for tile in row)
+    kinds = bytes(KIND_CODE_OF[tile] for row in board for tile in row)
+    return colors + kinds
+
+def unpack_board(data, h, w):
+    board = []
+    for y in range(h):
+        row = []
+        for x in range(w):
+            color, kind = data[y*w+x], data[h*w+y*w+x]
+            if color == EMPTY_CODE & 0xFF:
+                row.append(None)
+            elif kind:
+                row.append((TILE_NAMES[color], SPECIAL_KINDS_BY_CODE[kind]))
+            else:
+                row.append(TILE_NAMES[color])
+        board.append(row)
+    return board
+
+def _rollout_worker(task):
+    # Runs in the bot's process pool: reads the board from shared memory and averages
+    # the rollouts of a chunk of moves, each one with its own seed
+    shm_name, h, w, tiles, chunk = task
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        board = unpack_board(bytes(shm.buf[:2*h*w]), h, w)
+    finally:
+        shm.close()
+    results = []
+    for index, move, seeds in chunk:
+        window = move_window(board, move)
+        total = sum(simulate_move_and_score(*window, rng=random.Random(seed), tiles=tiles) for seed in seeds)
+        results.append((index, total / len(seeds)))
+    return results
+
+class MonteCarloBot:
+    # Scores each legal swap as the average of `rollouts` cascades with independent seeds,
+    # spread over a pool of `workers` processes. Every decision draws its seeds from the
+    # master seed, so a fixed seed always replays the same choices.
+    def __init__(self, rollouts=None, workers=None, seed=None, tiles=None):
+        self.rollouts = rollouts or BOT_ROLLOUTS
+        self.workers = workers or BOT_WORKERS
+        self.seed_rng = random.Random(seed if seed is not None else BOT_SEED)
+        self.tiles = tiles
+        self.pool = None
+
+    def score_moves(self, board, moves):
+        scores = [0.0] * len(moves)
+        jobs = []
+        legal = set(legal_moves(board))
+        for index, move in enumerate(moves):
+            seeds = [self.seed_rng.getrandbits(64) for _ in range(self.rollouts)]
+            # A swap without a match scores 0 in every rollout
+            if move in legal:
+                jobs.append((index, move, seeds))
+        if not jobs:
+            return scores
+        h, w = len(board), len(board[0])
+        data = pack_board(board)
+        shm = shared_memory.SharedMemory(create=True, size=len(data))
+        try:
+            shm.buf[:len(data)] = data
+            chunk_count = min(len(jobs), self.workers * 4)
+            tasks = [(shm.name, h, w, self.tiles, jobs[i::chunk_count]) for i in range(chunk_count)]
+            if self.workers > 1:
+                if self.pool is None:
+                    self.pool = multiprocessing.Pool(self.workers)
+                results = self.pool.map(_rollout_worker, tasks)
+            else:
+                results = [_rollout_worker(task) for task in tasks]
+        finally:
+            shm.close()
+            shm.unlink()
+        for chunk in results:
+            for index, score in chunk:
+                scores[index] = score
+        return scores
+
+    def choose_move(self, board, moves=None, objective=None):
+        moves = bot_moves(board, moves)
+        return pick_best_move(moves, self.score_moves(board, moves))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+class SearchTimeout(Exception):
+    # Raised inside an ExpectimaxBot search once its time budget is spent
+    pass
+
+class ExpectimaxBot:
+    # Looks up to max_depth moves ahead. Each move is a max node and the refill after it
+    # a chance node, estimated from `samples` random refills at the root and one below
+    # it. Moves are ordered by their own value and only the BOT_BEAM best are searched
+    # deeper; the last move of a line is scored by points alone, in one batch. The root
+    # is ordered by the greedy bot's scores (score_moves). The search deepens one move at a time
+    # while the next pass (about BOT_BEAM times the last one) fits in time_budget, and
+    # the deepest finished pass picks the move. A move is worth its points, plus
+    # OBJECTIVE_WEIGHT per tile of the objective color and SPECIAL_WEIGHTS per special
+    # tile it creates.
+    def __init__(self, time_budget=None, max_depth=None, samples=None, tiles=None):
+        self.time_budget = BOT_TIME_BUDGET if time_budget is None else time_budget
+        self.max_depth = max_depth or BOT_MAX_DEPTH
+        self.samples = samples or BOT_SAMPLES
+        self.tiles = tiles
+        self.depths = {}  # how many decisions finished each search depth
+
+    def value(self, points, cleared, created, objective):
+        value = points + sum(SPECIAL_WEIGHTS[kind] for color, kind in created)
+        if objective:
+            value += OBJECTIVE_WEIGHT * cleared.get(objective, 0)
+        return value
+
+    def search(self, board, depth, rng, objective, deadline):
+        # Value of the best line of `depth` moves on board
+        moves = legal_moves(board)
+        if not moves:
+            return 0
+        if depth == 1:
+            return max(score_moves(board, moves, self.tiles))
+        outcomes = []
+        for move in moves:
+            if time.perf_counter() > deadline:
+                raise SearchTimeout
+            after, points, cleared, created = simulate_turn(board, *move, rng, self.tiles)
+            outcomes.append((self.value(points, cleared, created, objective), after))
+        outcomes.sort(key=lambda outcome: outcome[0], reverse=True)
+        return max(value + self.search(after, depth-1, rng, objective, deadline) for value, after in outcomes[:BOT_BEAM])
+
+    def expected_value(self, board, move, depth, rng, objective, deadline):
+        # Average over sampled refills of the move's value and the best line after it.
+        # Big boards are searched on the move_window() around the move.
+        if len(board) > BOT_WINDOW or len(board[0]) > BOT_WINDOW:
+            board, *move = move_window(board, move)
+        total = 0
+        for _ in range(self.samples):
+            if time.perf_counter() > deadline:
+                raise SearchTimeout
+            after, points, cleared, created = simulate_turn(board, *move, rng, self.tiles)
+            total += self.value(points, cleared, created, objective)
+            if depth > 1:
+                total += self.search(after, depth-1, rng, objective, deadline)
+        return total / self.samples
+
+    def choose_move(self, board, moves=None, objective=None):
+        deadline = time.perf_counter() + self.time_budget
+        moves = bot_moves(board, moves)
+        # The greedy scores order the root; ties keep scan order
+        scores = score_moves(board, moves, self.tiles)
+        order = sorted(range(len(moves)), key=lambda i: -scores[i])
+        candidates = [moves[i] for i in order[:BOT_BEAM]]
+        # Seeded from the random module so random.seed() still makes the bot repeatable
+        rng = random.Random(random.getrandbits(64))
+        depth = 0
+        last_pass = 0
+        while depth < self.max_depth and len(candidates) > 1:
+            start = time.perf_counter()
+            if start + last_pass*BOT_BEAM > deadline:
+                break
+            try:
+                values = [self.expected_value(board, move, depth+1, rng, objective, deadline) for move in candidates]
+            except SearchTimeout:
+                break
+            last_pass = time.perf_counter() - start
+            depth += 1
+            order = sorted(range(len(candidates)), key=lambda i: -values[i])
+            candidates = [candidates[i] for i in order]
+        self.depths[depth] = self.depths.get(depth, 0) + 1
+        return candidates[0]
+
+    def close(self):
+        pass
+
+@profiled('create_board')
+def create_stable_board(rng=random, size=None, tiles=None):
+    # A board with no matches and at least one legal swap, built in one pass. Each cell
+    # never takes the color of the two tiles to its left or the two above it, when those
+    # match, so no run can form; with three or more colors one is always left.
+    size = size or grid_size
+    tiles = tiles or tile_types
+    board = [[None]*size for _ in range(size)]
+    for y in range(size):
+        for x in range(size):
+            banned = set()
+            if x >= 2 and board[y][x-1] == board[y][x-2]:
+                banned.add(board[y][x-1])
+            if y >= 2 and board[y-1][x] == board[y-2][x]:
+                banned.add(board[y-1][x])
+            board[y][x] = rng.choice([t for t in tiles if t not in banned])
+    if not has_possible_moves(board):
+        plant_move(board, rng, tiles)
+    return board
+
+def plant_move(board, rng=random, tiles=None):
+    # Rarely the board above is deadlocked. Recolor three cells into a pair plus a tile
+    # one step off the end of it, so swapping that tile in finishes a row, keeping the
+    # first placement and color that leaves the board without matches.
+    spots = [(x, y) for y in range(len(board)-1) for x in range(len(board[0])-2)]
+    rng.shuffle(spots)
+    for x, y in spots:
+        cells = [(x, y), (x+1, y), (x+2, y+1)]
+        old = [board[cy][cx] for cx, cy in cells]
+        for color in tiles or tile_types:
+            if color == board[y][x+2]:
+                continue
+            for cx, cy in cells:
+                board[cy][cx] = color
+            if not any(forms_match_at(board, cx, cy) for cx, cy in cells):
+                return
+        for (cx, cy), tile in zip(cells, old):
+            board[cy][cx] = tile
+
+class RefillBuffers:
+    # Upcoming refill tiles for each column, drawn from the game's RNG REFILL_CHUNK at a
+    # time instead of one random.choice per cell
+    def __init__(self, rng, size, tiles):
+        self.rng = rng
+        self.tiles = tiles
+        self.columns = [[] for _ in range(size)]
+
+    def draw(self, x, count):
+        column = self.columns[x]
+        if len(column) < count:
+            column.extend(self.rng.choices(self.tiles, k=max(count, REFILL_CHUNK)))
+        tiles = column[:count]
+        del column[:count]
+        return tiles
+
+    @profiled('refill')
+    def fill(self, board, dropped):
+        # Fills the empty cells at the top of each column in dropped (from drop_tiles)
+        for x, rows in dropped.items():
+            empty = 0
+            while empty < rows and board[empty][x] is None:
+                empty += 1
+            for y, tile in enumerate(self.draw(x, empty)):
+                writable_row(board, y)[x] = tile
+
+class ReplayLog:
+    # The seed and moves of one game; moves are (kind, x, y) as in REPLAY_MOVE and score
+    # is the score the game claimed when the log was written
+    def __init__(self, mode, size, tiles, seed, score=0, moves=None):
+        self.mode = mode
+        self.size = size
+        self.tiles = list(tiles)
+        self.seed = seed
+        self.score = score
+        self.moves = moves if moves is not None else []
+
+    def record_swap(self, x1, y1, x2, y2):
+        kind = REPLAY_SWAP_RIGHT if y1 == y2 else REPLAY_SWAP_DOWN
+        self.moves.append((kind, min(x1, x2), min(y1, y2)))
+
+    def record_bomb(self, x, y, color):
+        self.moves.append((REPLAY_BOMB + self.tiles.index(color), x, y))
+
+    def record_undo(self):
+        self.moves.append((REPLAY_UNDO, 0, 0))
+
+    def record_redo(self):
+        self.moves.append((REPLAY_REDO, 0, 0))
+
+    def to_bytes(self):
+        header = REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, game_modes.index(self.mode), len(self.tiles), self.size, self.seed, self.score, len(self.moves))
+        tiles = bytes(TILE_CODES[t] for t in self.tiles)
+        return header + tiles + b''.join(REPLAY_MOVE.pack(*move) for move in self.moves)
+
+def read_replay(data, offset=0):
+    # Returns the log starting at offset and the offset just past it
+    magic, version, mode, count, size, seed, score, n = REPLAY_HEADER.unpack_from(data, offset)
+    if magic != REPLAY_MAGIC or not 1 <= version <= REPLAY_VERSION:
+        raise ValueError(f"no replay log at byte {offset}")
+    offset += REPLAY_HEADER.size
+    tiles = [TILE_NAMES[code] for code in data[offset:offset+count]]
+    offset += count
+    end = offset + n*REPLAY_MOVE.size
+    moves = list(REPLAY_MOVE.iter_unpack(data[offset:end]))
+    return ReplayLog(game_modes[mode], size, tiles, seed, score, moves), end
+
+def read_replays(data):
+    logs = []
+    offset = 0
+    while offset < len(data):
+        log, offset = read_replay(data, offset)
+        logs.append(log)
+    return logs
+
+class Match3Engine:
+    # All the game rules without any UI: board, score, level, objectives and special
+    # tiles. Match3Game draws it; simulate_games plays it headless. size and tiles
+    # default to grid_size and tile_types. Every random draw comes from the game's own
+    # RNG, seeded with seed (a 64-bit int, random if None), and every move goes into
+    # log, so replay_game can play the game again. balance overrides entries of BALANCE;
+    # replay logs do not store it, so only games with the default balance replay.
+    def __init__(self, mode="Objective Mode", size=None, tiles=None, seed=None, balance=None):
+        self.mode = mode
+        self.balance = dict(BALANCE, **(balance or {}))
+        self.size = size or grid_size
+        self.tiles = list(tiles or tile_types)
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self.rng = random.Random(self.seed)
+        self.refills = RefillBuffers(self.rng, self.size, self.tiles)
+        self.log = ReplayLog(mode, self.size, self.tiles, self.seed)
+        self.board = CowBoard(create_stable_board(self.rng, self.size, self.tiles))
+        self.move_index = MoveIndex(self.board)
         self.score = 0
         self.level = 1
         self.high_score = 0
-        self.target_score = LEVEL_BASE_TARGET
-        self.selected = None  # (x, y) or None
-        self.bot_running = False
-        self.bot_should_stop = False
+        self.target_score = self.balance['level_base_target']
         self.objective_color = None
         self.objective_target = None
         self.objective_progress = 0
-        self.objective_label = None
+        self.objectives_completed = 0
+        self.game_over = False
+        self.new_high_score = False
+        # Goes up every time the board changes, so a bot search can tell it is stale
+        self.version = 0
+        self.cascade_depth = 0  # cascade steps since the last move
+        # Undo keeps each move as (cells, boards, progress before, progress after): the
+        # cells it changed (old and new tile), or for a move that dealt a new board, the
+        # boards before and after it. move_start holds the board and a snapshot of it
+        # while a move resolves.
+        self.history = deque(maxlen=UNDO_LIMIT)
+        self.redo_stack = []
+        self.move_start = None
         if self.mode == "Objective Mode":
             self.set_new_objective()
+
+    def set_new_objective(self):
+        self.objective_color = self.rng.choice(self.tiles)
+        balance = self.balance
+        self.objective_target = self.rng.randint(balance['objective_min'], balance['objective_max']) + self.level * balance['objective_per_level']
+        self.objective_progress = 0
+
+    def get_objective_text(self):
+        return f"Objective: Clear {self.objective_target} {self.objective_color} tiles ({self.objective_progress}/{self.objective_target})"
+
+    def has_moves(self):
+        self.move_index.sync(self.board)
+        return bool(self.move_index.moves)
+
+    def hint(self):
+        self.move_index.sync(self.board)
+        return self.move_index.hint()
+
+    def legal_moves(self):
+        self.move_index.sync(self.board)
+        return self.move_index.ordered()
+
+    def progress(self):
+        return (self.score, self.level, self.target_score, self.objective_color, self.objective_target, self.objective_progress, self.objectives_completed, self.game_over)
+
+    def set_progress(self, progress):
+        (self.score, self.level, self.target_score, self.objective_color, self.objective_target, self.objective_progress, self.objectives_completed, self.game_over) = progress
+
+    def begin_move(self):
+        self.move_start = (self.board, self.board.snapshot(), self.progress())
+
+    def end_move(self):
+        # The move and its cascade are over: store what it changed for undo. Only rows
+        # the move wrote to are no longer shared with the snapshot, so only those are
+        # compared. A level-up deals a new board, so then both boards are kept instead.
+        board, before, progress = self.move_start
+        self.move_start = None
+        if self.board is not board:
+            self.history.append((None, (before, self.board.snapshot()), progress, self.progress()))
+        else:
+            cells = []
+            for y, (old_row, new_row) in enumerate(zip(before, self.board)):
+                if old_row is not new_row:
+                    cells.extend((x, y, old, new) for x, (old, new) in enumerate(zip(old_row, new_row)) if old != new)
+            self.history.append((cells, None, progress, self.progress()))
+        self.redo_stack.clear()
+        PROFILER.record_cascade(self.cascade_depth)
+
+    def can_undo(self):
+        return self.move_start is None and bool(self.history)
+
+    def can_redo(self):
+        return self.move_start is None and bool(self.redo_stack)
+
+    def undo(self):
+        # Takes back the last move. The random draws are not taken back, so playing the
+        # same move again can refill differently.
+        if not self.can_undo():
+            return False
+        move = self.history.pop()
+        cells, boards, before, after = move
+        if boards:
+            self.board = boards[0].snapshot()
+        else:
+            for x, y, old, new in cells:
+                writable_row(self.board, y)[x] = old
+        self.set_progress(before)
+        self.redo_stack.append(move)
+        self.version += 1
+        self.log.record_undo()
+        return True
+
+    def redo(self):
+        if not self.can_redo():
+            return False
+        move = self.redo_stack.pop()
+        cells, boards, before, after = move
+        if boards:
+            self.board = boards[1].snapshot()
+        else:
+            for x, y, old, new in cells:
+                writable_row(self.board, y)[x] = new
+        self.set_progress(after)
+        self.history.append(move)
+        self.version += 1
+        self.log.record_redo()
+        return True
+
+    def try_swap(self, x1, y1, x2, y2):
+        # Swaps two tiles and returns the matches it made; a swap without matches is undone
+        self.begin_move()
+        swap_cells(self.board, x1, y1, x2, y2)
+        matches = find_matches_after_swap(self.board, x1, y1, x2, y2)
+        if not matches:
+            swap_cells(self.board, x1, y1, x2, y2)
+            self.move_start = None
+        else:
+            self.version += 1
+            self.cascade_depth = 0
+            self.log.record_swap(x1, y1, x2, y2)
+        return matches
+
+    @profiled('resolve')
+    def resolve_matches(self, matches):
+        # One cascade step: score the matches, create and fire special tiles, then drop
+        # and refill. Returns the matches the refill made, {} once the board has settled.
+        self.version += 1
+        self.cascade_depth += 1
+        points, color_counts, specials, dropped = apply_matches(self.board, matches, self.rng)
+        self.score += points
+        # Objective mode: update progress
+        if self.mode == "Objective Mode" and self.objective_color:
+            self.objective_progress += color_counts.get(self.objective_color, 0)
+        self.refills.fill(self.board, dropped)
+        # Progression: check for level up or objective
+        if self.mode == "Objective Mode" and self.objective_progress >= self.objective_target:
+            self.level_up_objective()
+            next_matches = {}
+        elif self.score >= self.target_score:
+            self.level_up()
+            next_matches = {}
+        else:
+            next_matches = self._settle(dropped)
+        if not next_matches:
+            self.end_move()
+        return next_matches
+
+    def activate_color_bomb(self, x, y, color):
+        # Remove all tiles of the given color. Returns the matches the refill made.
+        self.version += 1
+        self.cascade_depth = 0
+        self.begin_move()
+        self.log.record_bomb(x, y, color)
+        for yy, row in enumerate(self.board):
+            for xx, tile in enumerate(row):
+                if get_tile_type(tile) == color:
+                    writable_row(self.board, yy)[xx] = None
+        writable_row(self.board, y)[x] = None
+        dropped = drop_tiles(self.board)
+        self.refills.fill(self.board, dropped)
+        next_matches = self._settle(dropped)
+        if not next_matches:
+            self.end_move()
+        return next_matches
+
+    def _settle(self, dropped):
+        next_matches = find_matches_after_drop(self.board, dropped)
+        if not next_matches and not self.has_moves():
+            self.end_game()
+        return next_matches
+
+    def level_up_objective(self):
+        self.level += 1
+        self.objectives_completed += 1
+        self.target_score += self.balance['level_target_increment']
+        self.set_new_objective()
+        # Refill board for new level
+        self.board = CowBoard(create_stable_board(self.rng, self.size, self.tiles))
+
+    def level_up(self):
+        self.level += 1
+        self.target_score += self.balance['level_target_increment']
+        # Refill board for new level
+        self.board = CowBoard(create_stable_board(self.rng, self.size, self.tiles))
+
+    def end_game(self):
+        self.game_over = True
+        if self.score > self.high_score:
+            self.high_score = self.score
+            self.new_high_score = True
+
+    def play_move(self, x1, y1, x2, y2):
+        # Headless play: swap and run the whole cascade at once
+        matches = self.try_swap(x1, y1, x2, y2)
+        if not matches:
+            return False
+        while matches:
+            matches = self.resolve_matches(matches)
+        return True
+
+    def play_bomb(self, x, y, color):
+        # Headless color bomb: remove the color and run the whole cascade at once
+        matches = self.activate_color_bomb(x, y, color)
+        while matches:
+            matches = self.resolve_matches(matches)
+
+    def replay_bytes(self):
+        # The replay log so far, claiming the current score
+        self.log.score = self.score
+        return self.log.to_bytes()
+
+def simulate_games(n, mode="Endless Mode", max_moves=500, bot=None, size=None, tiles=None, logs=None):
+    # Plays n whole games with the bot and no window. Returns (score, level, moves) per
+    # game; the replay log of each game is appended to logs when given.
+    bot = bot or GreedyBot(tiles=tiles)
+    results = []
+    for _ in range(n):
+        engine = Match3Engine(mode, size, tiles)
+        moves = 0
+        while not engine.game_over and moves < max_moves:
+            start = time.perf_counter()
+            move = bot.choose_move(engine.board, engine.legal_moves(), engine.objective_color)
+            PROFILER.record('bot_think', time.perf_counter() - start)
+            if move is None or not engine.play_move(*move):
+                break
+            moves += 1
+        results.append((engine.score, engine.level, moves))
+        if logs is not None:
+            logs.append(engine.replay_bytes())
+    return results
+
+def replay_game(log):
+    # Plays the logged moves on a new engine with the same seed, stopping at the first
+    # move that does not match; a faithful log ends with the same score and moves
+    engine = Match3Engine(log.mode, log.size, log.tiles, log.seed)
+    for kind, x, y in log.moves:
+        if kind == REPLAY_UNDO or kind == REPLAY_REDO:
+            if not (engine.undo() if kind == REPLAY_UNDO else engine.redo()):
+                break
+            continue
+        x2, y2 = (x+1, y) if kind == REPLAY_SWAP_RIGHT else (x, y+1) if kind == REPLAY_SWAP_DOWN else (x, y)
+        if engine.game_over or x2 >= engine.size or y2 >= engine.size:
+            break
+        if kind >= REPLAY_BOMB:
+            tile = engine.board[y][x]
+            if kind - REPLAY_BOMB >= len(log.tiles) or not (is_special(tile) and get_special_kind(tile) == COLOR_BOMB):
+                break
+            engine.play_bomb(x, y, log.tiles[kind - REPLAY_BOMB])
+        elif not engine.play_move(x, y, x2, y2):
+            break
+    return engine
+
+def verify_replay(log):
+    engine = replay_game(log)
+    return engine.score == log.score and len(engine.log.moves) == len(log.moves)
+
+def run_simulation(args, bot):
+    mode = "Objective Mode" if args.mode == "objective" else "Endless Mode"
+    tiles = TILE_NAMES[:args.tiles]
+    bot = bot or GreedyBot(tiles=tiles)
+    logs = [] if args.record else None
+    start = time.perf_counter()
+    results = simulate_games(args.simulate, mode, args.max_moves, bot, args.size, tiles, logs)
+    elapsed = time.perf_counter() - start
+    print(f"{len(results)} games ({mode}, {args.size}x{args.size}, {args.tiles} tiles) in {elapsed:.2f}s: {len(results)/elapsed:.2f} games/s")
+    print(f"Average score: {sum(r[0] for r in results)/len(results):.1f}")
+    print(f"Average level reached: {sum(r[1] for r in results)/len(results):.2f}")
+    print(f"Average moves: {sum(r[2] for r in results)/len(results):.1f}")
+    if isinstance(bot, ExpectimaxBot):
+        depths = ", ".join(f"{depth}: {count}" for depth, count in sorted(bot.depths.items()))
+        print(f"Moves per search depth reached: {depths}")
+    if logs:
+        with open(args.record, 'wb') as f:
+            f.write(b''.join(logs))
+        print(f"Replay logs written to {args.record}")
+
+def run_replay(path, workers=1):
+    # Fast-forwards every log in the file through the engine, over workers processes,
+    # and checks its score. Returns True when they all match.
+    with open(path, 'rb') as f:
+        logs = read_replays(f.read())
+    start = time.perf_counter()
+    if workers > 1 and len(logs) > 1:
+        with multiprocessing.Pool(workers) as pool:
+            verified = pool.map(verify_replay, logs, chunksize=max(1, len(logs) // (workers*4)))
+    else:
+        verified = [verify_replay(log) for log in logs]
+    failed = [i for i, ok in enumerate(verified) if not ok]
+    elapsed = time.perf_counter() - start
+    print(f"{len(logs)} games replayed in {elapsed:.2f}s: {len(logs)/max(elapsed, 1e-9):.1f} games/s")
+    for i in failed:
+        print(f"Game {i}: replay does not reach the logged score {logs[i].score}")
+    print(f"{len(logs)-len(failed)} of {len(logs)} scores verified")
+    return not failed
+
+class BotWorker:
+    # Runs bot searches on a background thread so the Tk loop keeps drawing. submit()
+    # hands over a copy of the board, its version, the legal moves and the objective
+    # color; the chosen move comes back on
+    # results as (version, move). Only the latest submitted version is searched and
+    # reported, so cancel() or a newer submit() drops older searches.
+    def __init__(self, choose_move):
+        self.choose_move = choose_move
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.latest = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, board, version, moves=None, objective=None):
+        self.latest = version
+        self.requests.put((version, [row[:] for row in board], moves, objective))
+
+    def cancel(self):
+        self.latest = None
+
+    def close(self):
+        self.latest = None
+        self.requests.put(None)
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            version, board, moves, objective = request
+            if version != self.latest:
+                continue
+            # The bots are not thread-safe: this thread is the only one that uses them
+            start = time.perf_counter()
+            move = self.choose_move(board, moves, objective)
+            PROFILER.record('bot_think', time.perf_counter() - start)
+            if version == self.latest:
+                self.results.put((version, move))
+
+def beep_backend(freq, duration):
+    winsound.Beep(freq, duration)
+
+def silent_backend(freq, duration):
+    pass
+
+class AudioWorker:
+    # Plays sounds on one background thread, so a burst of matches never starts more
+    # threads. play() does not block: a sound that is already waiting is merged with the
+    # new one, and a sound that finds the queue full is dropped. backend(freq, duration)
+    # does the playing and blocks until the sound is over.
+    def __init__(self, backend, maxsize=SOUND_QUEUE_SIZE):
+        self.backend = backend
+        self.sounds = queue.Queue(maxsize)
+        self.waiting = set()
+        self.lock = threading.Lock()
+        self.played = 0
+        self.merged = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def play(self, freq, duration):
+        sound = (freq, duration)
+        with self.lock:
+            if sound in self.waiting:
+                self.merged += 1
+                return
+            try:
+                self.sounds.put_nowait(sound)
+            except queue.Full:
+                self.dropped += 1
+                return
+            self.waiting.add(sound)
+
+    def close(self):
+        # Throw away the waiting sounds so the stop request fits in the queue
+        with self.lock:
+            while True:
+                try:
+                    self.sounds.get_nowait()
+                except queue.Empty:
+                    break
+            self.waiting.clear()
+            self.sounds.put_nowait(None)
+
+    def run(self):
+        while True:
+            sound = self.sounds.get()
+            if sound is None:
+                return
+            with self.lock:
+                self.waiting.discard(sound)
+            try:
+                self.backend(*sound)
+            except RuntimeError:
+                pass  # winsound raises this when there is no sound device
+            self.played += 1
+
+class SpriteCache:
+    # One PhotoImage per tile look (base color, special kind, highlight), drawn once and
+    # shared by every cell that shows it.
+    def __init__(self, root, tile_size=None):
+        self.root = root
+        self.tile_size = tile_size or TILE_SIZE
+        self.images = {}
+        self.hex_colors = {}
+
+    def get(self, color, text, text_color):
+        key = (color, text, text_color)
+        image = self.images.get(key)
+        if image is None:
+            image = self.images[key] = self.render(color, text, text_color)
+        return image
+
+    def hex_color(self, name):
+        if name not in self.hex_colors:
+            r, g, b = self.root.winfo_rgb(name)
+            self.hex_colors[name] = f"#{r >> 8:02x}{g >> 8:02x}{b >> 8:02x}"
+        return self.hex_colors[name]
+
+    def render(self, color, text, text_color):
+        size = self.tile_size - 2*TILE_PAD
+        border = 2
+        fill, ink, edge = self.hex_color(color), self.hex_color(text_color), self.hex_color('black')
+        pixels = [[fill]*size for _ in range(size)]
+        for i in range(size):
+            for j in range(border):
+                pixels[j][i] = pixels[size-1-j][i] = pixels[i][j] = pixels[i][size-1-j] = edge
+        # Glyphs side by side with one blank column between them, centered
+        glyphs = [GLYPHS[ch] for ch in text if ch in GLYPHS]
+        scale = max(1, size // 18)
+        width = (len(glyphs)*6 - 1) * scale
+        height = 7 * scale
+        # Tiles too small for the text just show their color
+        if glyphs and width <= size - 2*border and height <= size - 2*border:
+            left, top = (size - width) // 2, (size - height) // 2
+            for n, glyph in enumerate(glyphs):
+                for gy, line in enumerate(glyph):
+                    for gx, ch in enumerate(line):
+                        if ch != '#':
+                            continue
+                        for py in range(scale):
+                            for px in range(scale):
+                                pixels[top + gy*scale + py][left + (n*6 + gx)*scale + px] = ink
+        image = tk.PhotoImage(master=self.root, width=size, height=size)
+        image.put(' '.join('{' + ' '.join(row) + '}' for row in pixels))
+        return image
+
+class Match3Game:
+    def __init__(self, root, bot=None, size=None, tiles=None, tile_size=None, turbo=False, sound_backend=None):
+        self.root = root
+        self.mode = self.ask_mode()
+        self.engine = Match3Engine(self.mode, size, tiles)
+        self.size = self.engine.size
+        self.tile_size = tile_size or TILE_SIZE
+        self.bot = bot or GreedyBot(tiles=self.engine.tiles)
+        self.selected = None  # (x, y) or None
+        self.bot_running = False
+        self.bot_should_stop = False
+        self.bot_worker = BotWorker(self.pick_bot_move)
+        self.bot_callback = None  # called with the move once the worker answers
+        self.audio = AudioWorker(sound_backend or (beep_backend if SOUND_AVAILABLE else silent_backend))
+        self.cascading = False
+        # Turbo: the worker still searches, but the bot's moves and their cascades run
+        # straight through the engine and the board is redrawn at most TURBO_FPS times
+        # a second
+        self.turbo = turbo
+        self.last_turbo_draw = 0.0
+        self.bot_poll_ms = BOT_POLL_MS
+        self.objective_label = None
+        root.grid_columnconfigure(0, weight=1)
         # Top info frame for labels
         self.info_frame = tk.Frame(root)
-        self.info_frame.grid(row=0, column=0, columnspan=grid_size, sticky='ew')
+        self.info_frame.grid(row=0, column=0, sticky='ew')
         self.info_frame.grid_columnconfigure(0, weight=1)
         self.info_frame.grid_columnconfigure(1, weight=1)
         self.info_frame.grid_columnconfigure(2, weight=1)
-        self.score_label = tk.Label(self.info_frame, text=f"Score: {self.score}", font=("Arial", 16), fg=SCORE_NORMAL_COLOR, anchor='w', justify='left')
+        self.score_label = tk.Label(self.info_frame, text=f"Score: {self.engine.score}", font=("Arial", 16), fg=SCORE_NORMAL_COLOR, anchor='w', justify='left')
         self.score_label.grid(row=0, column=0, sticky='w')
-        self.level_label = tk.Label(self.info_frame, text=f"Level: {self.level}", font=("Arial", 16))
+        self.level_label = tk.Label(self.info_frame, text=f"Level: {self.engine.level}", font=("Arial", 16))
         self.level_label.grid(row=0, column=1)
-        self.target_label = tk.Label(self.info_frame, text=f"Target: {self.target_score}", font=("Arial", 16))
+        self.target_label = tk.Label(self.info_frame, text=f"Target: {self.engine.target_score}", font=("Arial", 16))
         self.target_label.grid(row=0, column=2, sticky='e')
         if self.mode == "Objective Mode":
-            self.objective_label = tk.Label(root, text=self.get_objective_text(), font=("Arial", 15, "bold"), fg=self.get_objective_color())
-            self.objective_label.grid(row=1, column=0, columnspan=grid_size, sticky='ew')
-        self.high_score_label = tk.Label(root, text=f"High Score: {self.high_score}", font=("Arial", 12), anchor='e', justify='right')
-        self.high_score_label.grid(row=grid_size+2, column=0, columnspan=grid_size, sticky='e')
-        # Canvas for board
-        self.canvas = tk.Canvas(root, width=grid_size*TILE_SIZE, height=grid_size*TILE_SIZE, bg='white', highlightthickness=0)
-        self.canvas.grid(row=2, column=0, columnspan=grid_size)
+            self.objective_label = tk.Label(root, text=self.engine.get_objective_text(), font=("Arial", 15, "bold"), fg=self.get_objective_color())
+            self.objective_label.grid(row=1, column=0, sticky='ew')
+        # Canvas for board: a viewport of at most MAX_VIEWPORT pixels that scrolls over
+        # the whole board when it is bigger
+        board_px = self.size*self.tile_size
+        view_px = min(board_px, MAX_VIEWPORT)
+        self.board_frame = tk.Frame(root)
+        self.board_frame.grid(row=2, column=0)
+        self.canvas = tk.Canvas(self.board_frame, width=view_px, height=view_px, bg='white', highlightthickness=0, scrollregion=(0, 0, board_px, board_px))
+        self.canvas.grid(row=0, column=0)
+        if board_px > view_px:
+            x_bar = tk.Scrollbar(self.board_frame, orient=tk.HORIZONTAL, command=self.canvas.xview)
+            x_bar.grid(row=1, column=0, sticky='ew')
+            y_bar = tk.Scrollbar(self.board_frame, orient=tk.VERTICAL, command=self.canvas.yview)
+            y_bar.grid(row=0, column=1, sticky='ns')
+            self.canvas.config(xscrollcommand=x_bar.set, yscrollcommand=y_bar.set)
+            for event in ('<MouseWheel>', '<Shift-MouseWheel>', '<Button-4>', '<Button-5>', '<Shift-Button-4>', '<Shift-Button-5>'):
+                self.canvas.bind(event, self.on_scroll)
         self.canvas.bind('<Button-1>', self.on_canvas_click)
-        self.tile_items = [[None for _ in range(grid_size)] for _ in range(grid_size)]
+        self.high_score_label = tk.Label(root, text=f"High Score: {self.engine.high_score}", font=("Arial", 12), anchor='e', justify='right')
+        self.high_score_label.grid(row=3, column=0, sticky='e')
+        # One image item per cell, created once and pointed at another sprite when the
+        # cell changes; rendered remembers what each cell shows right now
+        self.sprites = SpriteCache(root, self.tile_size)
+        self.tile_items = [[None for _ in range(self.size)] for _ in range(self.size)]
+        self.rendered = [[None for _ in range(self.size)] for _ in range(self.size)]
+        self.create_tile_items()
         self.animating = False
         # Bot controls
-        self.bot_button = tk.Button(root, text="Bot Move", font=("Arial", 12), command=self.bot_move)
-        self.bot_button.grid(row=grid_size+3, column=0, columnspan=grid_size//3, sticky="we")
-        self.start_bot_button = tk.Button(root, text="Start Bot", font=("Arial", 12), command=self.start_bot)
-        self.start_bot_button.grid(row=grid_size+3, column=grid_size//3, columnspan=grid_size//3, sticky="we")
-        self.stop_bot_button = tk.Button(root, text="Stop Bot", font=("Arial", 12), command=self.stop_bot)
-        self.stop_bot_button.grid(row=grid_size+3, column=2*grid_size//3, columnspan=grid_size-2*grid_size//3, sticky="we")
+        self.controls = tk.Frame(root)
+        self.controls.grid(row=4, column=0, sticky='ew')
+        for column in range(3):
+            self.controls.grid_columnconfigure(column, weight=1)
+        self.bot_button = tk.Button(self.controls, text="Bot Move", font=("Arial", 12), command=self.bot_move)
+        self.bot_button.grid(row=0, column=0, sticky="we")
+        self.start_bot_button = tk.Button(self.controls, text="Start Bot", font=("Arial", 12), command=self.start_bot)
+        self.start_bot_button.grid(row=0, column=1, sticky="we")
+        self.stop_bot_button = tk.Button(self.controls, text="Stop Bot", font=("Arial", 12), command=self.stop_bot)
+        self.stop_bot_button.grid(row=0, column=2, sticky="we")
+        self.hint_button = tk.Button(self.controls, text="Hint", font=("Arial", 12), command=self.show_hint)
+        self.hint_button.grid(row=1, column=0, sticky="we")
+        self.undo_button = tk.Button(self.controls, text="Undo", font=("Arial", 12), command=self.undo)
+        self.undo_button.grid(row=1, column=1, sticky="we")
+        self.redo_button = tk.Button(self.controls, text="Redo", font=("Arial", 12), command=self.redo)
+        self.redo_button.grid(row=1, column=2, sticky="we")
+        self.turbo_button = tk.Button(self.controls, text=self.turbo_text(), font=("Arial", 12), command=self.toggle_turbo)
+        self.turbo_button.grid(row=2, column=0, columnspan=3, sticky="we")
+        root.bind('<Control-z>', self.undo)
+        root.bind('<Control-y>', self.redo)
+        # F3 shows frame time, bot think time and cascade depth over the board
+        self.perf_overlay = False
+        self.perf_after = None  # the pending overlay refresh
+        self.profiled_before = False  # PROFILER.enabled before the overlay turned it on
+        self.last_frame = None
+        root.bind('<F3>', self.toggle_perf_overlay)
         self.update_board()
 
     def ask_mode(self):
@@ -229,25 +1868,34 @@ class Match3Game:
         self.root.wait_window(dialog)
         return mode_choice['mode'] or "Objective Mode"
 
-    def set_new_objective(self):
-        self.objective_color = random.choice(tile_types)
-        self.objective_target = random.randint(12, 20) + self.level * 2
-        self.objective_progress = 0
-
-    def get_objective_text(self):
-        return f"Objective: Clear {self.objective_target} {self.objective_color} tiles ({self.objective_progress}/{self.objective_target})"
-
     def get_objective_color(self):
-        return tile_colors.get(self.objective_color, 'black')
+        return tile_colors.get(self.engine.objective_color, 'black')
 
     def canvas_coords(self, x, y):
-        return x*TILE_SIZE+TILE_PAD, y*TILE_SIZE+TILE_PAD
+        return x*self.tile_size+TILE_PAD, y*self.tile_size+TILE_PAD
 
-    def draw_tile(self, x, y, tile, highlight=False):
+    def on_scroll(self, event):
+        step = -1 if event.num == 4 or getattr(event, 'delta', 0) > 0 else 1
+        if event.state & 1:  # Shift scrolls sideways
+            self.canvas.xview_scroll(step, 'units')
+        else:
+            self.canvas.yview_scroll(step, 'units')
+
+    def scroll_to(self, x, y):
+        # Center the viewport on a cell, as far as the board edges allow
+        board_px = self.size*self.tile_size
+        view_px = min(board_px, MAX_VIEWPORT)
+        if board_px == view_px:
+            return
+        center = self.tile_size // 2
+        self.canvas.xview_moveto(max(0, x*self.tile_size + center - view_px/2) / board_px)
+        self.canvas.yview_moveto(max(0, y*self.tile_size + center - view_px/2) / board_px)
+
+    def tile_look(self, tile, highlight=False):
+        # Fill color, text and text color for a tile
         color = tile_colors.get(get_tile_type(tile), 'gray')
         if is_special(tile):
             kind = get_special_kind(tile)
-            base = get_tile_type(tile)
             if kind == STRIPED_H:
                 color = SPECIAL_TILE_BG[STRIPED_H]
             elif kind == STRIPED_V:
@@ -256,9 +1904,7 @@ class Match3Game:
                 color = SPECIAL_TILE_BG[COLOR_BOMB]
         if highlight:
             color = HIGHLIGHT_COLOR
-        x0, y0 = self.canvas_coords(x, y)
-        rect = self.canvas.create_rectangle(x0, y0, x0+TILE_SIZE-2*TILE_PAD, y0+TILE_SIZE-2*TILE_PAD, fill=color, outline='black', width=2)
-        text = get_tile_type(tile)
+        text = get_tile_type(tile) or ''
         if is_special(tile):
             kind = get_special_kind(tile)
             if kind == STRIPED_H:
@@ -267,33 +1913,63 @@ class Match3Game:
                 text += SPECIAL_TILE_TEXT[STRIPED_V]
             elif kind == COLOR_BOMB:
                 text = SPECIAL_TILE_TEXT[COLOR_BOMB]
-        txt = self.canvas.create_text(x0+TILE_SIZE//2-TILE_PAD, y0+TILE_SIZE//2-TILE_PAD, text=text, font=("Arial", 18, "bold"), fill='white' if is_special(tile) and get_special_kind(tile)==COLOR_BOMB else 'black')
-        return rect, txt
+        text_color = 'white' if is_special(tile) and get_special_kind(tile)==COLOR_BOMB else 'black'
+        return color, text, text_color
 
+    def create_tile_items(self):
+        for y in range(self.size):
+            for x in range(self.size):
+                x0, y0 = self.canvas_coords(x, y)
+                self.tile_items[y][x] = self.canvas.create_image(x0, y0, anchor='nw')
+                self.rendered[y][x] = None
+
+    def render_tile(self, x, y, tile, highlight=False):
+        # Only touches the canvas when the cell looks different from last time
+        state = (tile, bool(highlight))
+        if self.rendered[y][x] == state:
+            return
+        self.rendered[y][x] = state
+        sprite = self.sprites.get(*self.tile_look(tile, highlight))
+        self.canvas.itemconfig(self.tile_items[y][x], image=sprite)
+
+    @profiled('update_board')
     def update_board(self, highlight_matches=None):
-        self.canvas.delete('all')
-        for y in range(grid_size):
-            for x in range(grid_size):
+        # Selection and hint outlines and sparkles are tagged 'overlay' and redrawn by callers
+        self.canvas.delete('overlay')
+        board = self.engine.board
+        for y in range(self.size):
+            for x in range(self.size):
                 highlight = highlight_matches and (x, y) in highlight_matches
-                self.draw_tile(x, y, self.board[y][x], highlight=highlight)
-        self.score_label.config(text=f"Score: {self.score}", fg=SCORE_NORMAL_COLOR)
-        self.level_label.config(text=f"Level: {self.level}")
-        self.target_label.config(text=f"Target: {self.target_score}")
-        self.high_score_label.config(text=f"High Score: {self.high_score}")
+                self.render_tile(x, y, board[y][x], highlight=highlight)
+        self.score_label.config(text=f"Score: {self.engine.score}", fg=SCORE_NORMAL_COLOR)
+        self.level_label.config(text=f"Level: {self.engine.level}")
+        self.target_label.config(text=f"Target: {self.engine.target_score}")
+        self.high_score_label.config(text=f"High Score: {self.engine.high_score}")
         if self.mode == "Objective Mode" and self.objective_label:
-            self.objective_label.config(text=self.get_objective_text(), fg=self.get_objective_color())
+            self.objective_label.config(text=self.engine.get_objective_text(), fg=self.get_objective_color())
+        self.update_controls()
+
+    def update_controls(self):
         # Visually disable bot controls if animating
         state = tk.DISABLED if self.bot_running or self.animating else tk.NORMAL
         self.bot_button.config(state=state)
+        busy = self.bot_running or self.animating or self.cascading
+        # A hint mid-cascade would come from a board that still holds unresolved matches
+        self.hint_button.config(state=tk.DISABLED if busy else tk.NORMAL)
+        self.undo_button.config(state=tk.NORMAL if not busy and self.engine.can_undo() else tk.DISABLED)
+        self.redo_button.config(state=tk.NORMAL if not busy and self.engine.can_redo() else tk.DISABLED)
         self.start_bot_button.config(state=state if not self.bot_running and not self.animating else tk.DISABLED)
         self.stop_bot_button.config(state=tk.NORMAL if self.bot_running else tk.DISABLED)
 
     def on_canvas_click(self, event):
-        if self.bot_running or self.animating:
+        # No moves during a cascade either: the engine resolves it one step at a time,
+        # and a replay plays every move after the cascade before it. Nor while the bot
+        # searches for a Bot Move click: its swap would start under the player's.
+        if self.bot_running or self.bot_callback or self.animating or self.cascading:
             return
-        x = event.x // TILE_SIZE
-        y = event.y // TILE_SIZE
-        if not (0 <= x < grid_size and 0 <= y < grid_size):
+        x = int(self.canvas.canvasx(event.x)) // self.tile_size
+        y = int(self.canvas.canvasy(event.y)) // self.tile_size
+        if not (0 <= x < self.size and 0 <= y < self.size):
             return
         if self.selected is None:
             self.selected = (x, y)
@@ -305,8 +1981,8 @@ class Match3Game:
                 self.selected = None
                 self.update_board()
                 return
-            t1 = self.board[y1][x1]
-            t2 = self.board[y][x]
+            t1 = self.engine.board[y1][x1]
+            t2 = self.engine.board[y][x]
             if is_special(t1) and get_special_kind(t1) == COLOR_BOMB:
                 self.activate_color_bomb(x1, y1, get_tile_type(t2))
                 self.selected = None
@@ -329,40 +2005,109 @@ class Match3Game:
         if self.selected:
             x, y = self.selected
             x0, y0 = self.canvas_coords(x, y)
-            self.canvas.create_rectangle(x0, y0, x0+TILE_SIZE-2*TILE_PAD, y0+TILE_SIZE-2*TILE_PAD, outline='orange', width=4)
+            self.canvas.create_rectangle(x0, y0, x0+self.tile_size-2*TILE_PAD, y0+self.tile_size-2*TILE_PAD, outline='orange', width=4, tags='overlay')
+
+    def undo(self, event=None):
+        if self.bot_running or self.animating or self.cascading:
+            return
+        if self.engine.undo():
+            self.selected = None
+            self.update_board()
+
+    def redo(self, event=None):
+        if self.bot_running or self.animating or self.cascading:
+            return
+        if self.engine.redo():
+            self.selected = None
+            self.update_board()
+
+    def show_hint(self):
+        if self.bot_running or self.animating or self.cascading:
+            return
+        move = self.engine.hint()
+        if move is None:
+            return
+        self.selected = None
+        self.update_board()
+        x1, y1, x2, y2 = move
+        self.scroll_to(x1, y1)
+        for x, y in [(x1, y1), (x2, y2)]:
+            x0, y0 = self.canvas_coords(x, y)
+            self.canvas.create_rectangle(x0, y0, x0+self.tile_size-2*TILE_PAD, y0+self.tile_size-2*TILE_PAD, outline=HINT_COLOR, width=4, tags='overlay')
+
+    def after(self, ms, callback):
+        # root.after for the animation chain; when profiling, records how late the
+        # callback runs as timer_lag
+        if not PROFILER.enabled:
+            return self.root.after(ms, callback)
+        due = time.perf_counter() + ms/1000
+        def run():
+            PROFILER.record('timer_lag', max(0.0, time.perf_counter() - due))
+            callback()
+        return self.root.after(ms, run)
+
+    def toggle_perf_overlay(self, event=None):
+        self.perf_overlay = not self.perf_overlay
+        if self.perf_overlay:
+            self.profiled_before = PROFILER.enabled
+            PROFILER.enabled = True
+            self.refresh_perf_overlay()
+        else:
+            # Stop the refresh loop, or a quick off and on would run two of them
+            if self.perf_after is not None:
+                self.root.after_cancel(self.perf_after)
+                self.perf_after = None
+            PROFILER.enabled = self.profiled_before
+            self.canvas.delete('perf')
+
+    def refresh_perf_overlay(self):
+        self.canvas.delete('perf')
+        x0, y0 = self.canvas.canvasx(0), self.canvas.canvasy(0)
+        text = (f"frame {PROFILER.last_ms('frame'):5.1f} ms\n"
+                f"draw {PROFILER.last_ms('update_board'):5.1f} ms\n"
+                f"bot {PROFILER.last_ms('bot_think'):6.1f} ms\n"
+                f"cascade {self.engine.cascade_depth}")
+        label = self.canvas.create_text(x0+6, y0+6, text=text, anchor='nw', fill='white', font=("Courier", 10, "bold"), tags='perf')
+        self.canvas.create_rectangle(self.canvas.bbox(label), fill='black', outline='', tags='perf')
+        self.canvas.tag_raise(label)
+        self.perf_after = self.root.after(PERF_OVERLAY_MS, self.refresh_perf_overlay)
+
+    def frame_tick(self):
+        # Time since the previous animation frame, as the frame phase
+        now = time.perf_counter()
+        if self.last_frame is not None and PROFILER.enabled:
+            PROFILER.record('frame', now - self.last_frame)
+        self.last_frame = now
 
     def animate_swap(self, x1, y1, x2, y2):
         self.animating = True
-        dx = (x2 - x1) * ANIMATION_SPEED
-        dy = (y2 - y1) * ANIMATION_SPEED
-        steps = TILE_SIZE // ANIMATION_SPEED
-        tile1 = self.board[y1][x1]
-        tile2 = self.board[y2][x2]
-        # Draw initial positions
+        speed = min(ANIMATION_SPEED, self.tile_size)
+        dx = (x2 - x1) * speed
+        dy = (y2 - y1) * speed
+        steps = self.tile_size // speed
+        # Slide the two cells' own items, then put them back once the swap is decided
         self.update_board()
-        rect1, txt1 = self.draw_tile(x1, y1, tile1)
-        rect2, txt2 = self.draw_tile(x2, y2, tile2)
+        item1 = self.tile_items[y1][x1]
+        item2 = self.tile_items[y2][x2]
+        self.canvas.tag_raise(item1)
+        self.canvas.tag_raise(item2)
+        self.last_frame = None
         def move_step(step):
+            self.frame_tick()
             if step > steps:
-                self.canvas.delete(rect1)
-                self.canvas.delete(txt1)
-                self.canvas.delete(rect2)
-                self.canvas.delete(txt2)
-                self.board[y1][x1], self.board[y2][x2] = self.board[y2][x2], self.board[y1][x1]
-                matches = find_matches_with_lengths(self.board)
+                self.canvas.move(item1, -dx*steps, -dy*steps)
+                self.canvas.move(item2, dx*steps, dy*steps)
+                matches = self.engine.try_swap(x1, y1, x2, y2)
                 if not matches:
-                    self.board[y1][x1], self.board[y2][x2] = self.board[y2][x2], self.board[y1][x1]
                     self.animating = False
                     self.update_board()
                     return
                 self.process_matches(matches)
                 self.animating = False
                 return
-            self.canvas.move(rect1, dx, dy)
-            self.canvas.move(txt1, dx, dy)
-            self.canvas.move(rect2, -dx, -dy)
-            self.canvas.move(txt2, -dx, -dy)
-            self.root.after(10, lambda: move_step(step+1))
+            self.canvas.move(item1, dx, dy)
+            self.canvas.move(item2, -dx, -dy)
+            self.after(10, lambda: move_step(step+1))
         move_step(1)
 
     def highlight_matches(self, matches, callback):
@@ -370,151 +2115,103 @@ class Match3Game:
         self.update_board(highlight_matches=matches)
         for (x, y) in matches:
             self.show_sparkle(x, y)
-        self.root.after(250, callback)
+        self.after(250, callback)
 
     def show_sparkle(self, x, y):
         # Simple sparkle effect: draw a few white circles
         x0, y0 = self.canvas_coords(x, y)
         for i in range(6):
             r = 4 + i*2
-            oval = self.canvas.create_oval(x0+TILE_SIZE//2-r, y0+TILE_SIZE//2-r, x0+TILE_SIZE//2+r, y0+TILE_SIZE//2+r, outline='white', width=2)
+            c = self.tile_size // 2
+            oval = self.canvas.create_oval(x0+c-r, y0+c-r, x0+c+r, y0+c+r, outline='white', width=2, tags='overlay')
             self.root.after(40*i, lambda o=oval: self.canvas.delete(o))
 
     def play_match_sound(self):
-        if SOUND_AVAILABLE:
-            threading.Thread(target=lambda: winsound.Beep(800, 120)).start()
+        self.audio.play(*MATCH_SOUND)
 
     def pop_score(self):
         self.score_label.config(fg=SCORE_POP_COLOR, font=("Arial", 18, "bold"))
         self.root.after(200, lambda: self.score_label.config(fg=SCORE_NORMAL_COLOR, font=("Arial", 16)))
 
     def process_matches(self, matches):
+        self.cascading = True
         # Visual highlight
         self.highlight_matches(matches, lambda: self._after_highlight(matches))
         self.play_match_sound()
         self.pop_score()
 
     def _after_highlight(self, matches):
-        # Special tile creation and effect
-        specials_to_create = []
-        color_counts = {c: 0 for c in tile_types}
-        for pos, length in matches.items():
-            x, y = pos
-            base = get_tile_type(self.board[y][x])
-            if base in color_counts:
-                color_counts[base] += 1
-            if length == 4:
-                # Striped tile: randomly horizontal or vertical
-                kind = random.choice([STRIPED_H, STRIPED_V])
-                specials_to_create.append((x, y, (base, kind)))
-            elif length >= 5:
-                # Color bomb
-                specials_to_create.append((x, y, (base, COLOR_BOMB)))
-        # Objective mode: update progress
-        if self.mode == "Objective Mode" and self.objective_color:
-            self.objective_progress += color_counts.get(self.objective_color, 0)
-        # Scoring: 3 in a row = 1pt/tile, 4 in a row = 2pt/tile, 5+ in a row = 3pt/tile
-        for pos, length in matches.items():
-            if length >= 5:
-                self.score += 3
-            elif length == 4:
-                self.score += 2
-            else:
-                self.score += 1
-        # Place special tiles after clearing
-        clear_matches(self.board, matches)
-        for x, y, special in specials_to_create:
-            self.board[y][x] = special
-        # Activate special effects if matched
-        for pos in matches:
-            x, y = pos
-            tile = self.board[y][x]
-            if is_special(tile):
-                kind = get_special_kind(tile)
-                if kind == STRIPED_H:
-                    for xx in range(grid_size):
-                        self.board[y][xx] = None
-                elif kind == STRIPED_V:
-                    for yy in range(grid_size):
-                        self.board[yy][x] = None
-        drop_tiles(self.board)
-        refill_board(self.board)
-        self.update_board()
-        # Progression: check for level up or objective
-        if self.mode == "Objective Mode" and self.objective_progress >= self.objective_target:
-            self.level_up_objective()
-            return
-        if self.score >= self.target_score:
-            self.level_up()
-            return
-        next_matches = find_matches_with_lengths(self.board)
-        if next_matches:
-            self.process_matches(next_matches)
-        else:
-            if not has_possible_moves(self.board):
-                self.end_game()
-
-    def level_up_objective(self):
-        self.level += 1
-        self.target_score += LEVEL_TARGET_INCREMENT
-        self.set_new_objective()
-        self.score_label.config(fg='green')
-        self.update_board()
-        # Refill board for new level
-        self.board = create_board()
-        while find_matches_with_lengths(self.board):
-            self.board = create_board()
+        level = self.engine.level
+        next_matches = self.engine.resolve_matches(matches)
+        if self.engine.level != level:
+            self.score_label.config(fg='green')
         self.update_board()
+        self.continue_cascade(next_matches)
 
     def activate_color_bomb(self, x, y, color):
-        # Remove all tiles of the given color
-        for yy in range(grid_size):
-            for xx in range(grid_size):
-                if get_tile_type(self.board[yy][xx]) == color:
-                    self.board[yy][xx] = None
-        self.board[y][x] = None
-        drop_tiles(self.board)
-        refill_board(self.board)
+        next_matches = self.engine.activate_color_bomb(x, y, color)
         self.update_board()
-        next_matches = find_matches_with_lengths(self.board)
+        self.continue_cascade(next_matches)
+
+    def continue_cascade(self, next_matches):
         if next_matches:
             self.process_matches(next_matches)
-        else:
-            if not has_possible_moves(self.board):
-                self.end_game()
-
-    def level_up(self):
-        self.level += 1
-        self.target_score += LEVEL_TARGET_INCREMENT
-        self.score_label.config(fg='green')
-        self.update_board()
-        # Refill board for new level
-        self.board = create_board()
-        while find_matches_with_lengths(self.board):
-            self.board = create_board()
-        self.update_board()
+            return
+        self.cascading = False
+        self.update_controls()
+        if self.engine.game_over:
+            self.end_game()
 
     def end_game(self):
-        if self.score > self.high_score:
-            self.high_score = self.score
+        if self.engine.new_high_score:
             self.update_board()
-            messagebox.showinfo("Game Over", f"New High Score! {self.score}")
+            messagebox.showinfo("Game Over", f"New High Score! {self.engine.score}")
         else:
-            messagebox.showinfo("Game Over", f"No more possible moves! Final Score: {self.score}")
+            messagebox.showinfo("Game Over", f"No more possible moves! Final Score: {self.engine.score}")
         self.root.destroy()
 
+    def pick_bot_move(self, board, moves, objective):
+        # Runs on the bot worker thread, on a copy of the board
+        return self.bot.choose_move(board, moves, objective)
+
+    def request_bot_move(self, callback, poll_ms=BOT_POLL_MS):
+        self.bot_callback = callback
+        self.bot_poll_ms = poll_ms
+        self.bot_worker.submit(self.engine.board, self.engine.version, self.engine.legal_moves(), self.engine.objective_color)
+        self.root.after(poll_ms, self.poll_bot)
+
+    def poll_bot(self):
+        if self.bot_callback is None:
+            return
+        if self.animating or self.cascading:
+            # The engine version stays put through a swap animation and each cascade
+            # step's highlight, so a result now could look current; hold it until the
+            # move is over, when the version check sees the change
+            self.root.after(self.bot_poll_ms, self.poll_bot)
+            return
+        try:
+            version, move = self.bot_worker.results.get_nowait()
+        except queue.Empty:
+            self.root.after(self.bot_poll_ms, self.poll_bot)
+            return
+        if version != self.engine.version:
+            # The board changed while the bot was thinking: search again
+            self.bot_worker.submit(self.engine.board, self.engine.version, self.engine.legal_moves(), self.engine.objective_color)
+            self.root.after(self.bot_poll_ms, self.poll_bot)
+            return
+        callback, self.bot_callback = self.bot_callback, None
+        callback(move)
+
+    def cancel_bot_search(self):
+        self.bot_callback = None
+        self.bot_worker.cancel()
+
     def bot_move(self):
-        best_score = -1
-        best_move = None
-        for y in range(grid_size):
-            for x in range(grid_size):
-                for dx, dy in [(1,0),(0,1)]:
-                    nx, ny = x+dx, y+dy
-                    if nx < grid_size and ny < grid_size:
-                        score = simulate_move_and_score(self.board, x, y, nx, ny)
-                        if score > best_score:
-                            best_score = score
-                            best_move = (x, y, nx, ny)
+        if self.bot_callback or self.animating or self.cascading:
+            return
+        self.request_bot_move(self.play_bot_move)
+
+    def play_bot_move(self, best_move):
         if best_move:
             self.animate_swap(*best_move)
             self.update_board()
@@ -529,29 +2226,63 @@ class Match3Game:
         self.root.after(200, self.bot_auto_play)
 
     def stop_bot(self):
+        # Drop any search in flight; a swap that is already animating still finishes
         self.bot_should_stop = True
-        # The bot will stop after the current move
+        self.cancel_bot_search()
+        self.bot_running = False
+        self.update_board()
 
     def bot_auto_play(self):
-        if self.bot_should_stop:
+        if self.bot_should_stop or not self.bot_running:
             self.bot_running = False
             self.update_board()
             return
-        if not has_possible_moves(self.board):
+        if self.animating or self.cascading:
+            # Wait for the last move's cascade before searching the next one
+            self.root.after(BOT_POLL_MS, self.bot_auto_play)
+            return
+        if not self.engine.has_moves():
             self.bot_running = False
             self.update_board()
             return
-        best_score = -1
-        best_move = None
-        for y in range(grid_size):
-            for x in range(grid_size):
-                for dx, dy in [(1,0),(0,1)]:
-                    nx, ny = x+dx, y+dy
-                    if nx < grid_size and ny < grid_size:
-                        score = simulate_move_and_score(self.board, x, y, nx, ny)
-                        if score > best_score:
-                            best_score = score
-                            best_move = (x, y, nx, ny)
+        if self.turbo:
+            self.request_bot_move(self.turbo_move, TURBO_POLL_MS)
+            return
+        self.request_bot_move(self.auto_play_move)
+
+    def turbo_text(self):
+        return "Turbo: On" if self.turbo else "Turbo: Off"
+
+    def toggle_turbo(self):
+        # Takes effect from the bot's next move
+        self.turbo = not self.turbo
+        self.turbo_button.config(text=self.turbo_text())
+
+    def turbo_move(self, best_move):
+        # Plays the worker's move and its whole cascade at once. The board is drawn only
+        # if 1/TURBO_FPS has passed since the last drawing, and Tk handles its events
+        # while the worker searches the next move.
+        if not self.bot_running:
+            return
+        if best_move is None or not self.engine.play_move(*best_move):
+            self.bot_running = False
+            self.update_board()
+            messagebox.showinfo("Bot", "No possible moves for the bot!")
+            return
+        now = time.perf_counter()
+        if self.engine.game_over or now - self.last_turbo_draw >= 1/TURBO_FPS:
+            self.last_turbo_draw = now
+            self.frame_tick()
+            self.update_board()
+        if self.engine.game_over:
+            self.bot_running = False
+            self.end_game()
+            return
+        self.bot_auto_play()
+
+    def auto_play_move(self, best_move):
+        if not self.bot_running:
+            return
         if best_move:
             self.animate_swap(*best_move)
             self.update_board()
@@ -562,10 +2293,65 @@ class Match3Game:
             messagebox.showinfo("Bot", "No possible moves for the bot!")
 
 def main():
-    root = tk.Tk()
-    root.title("Match 3 Game - Modes & Challenges!")
-    game = Match3Game(root)
-    root.mainloop()
+    parser = argparse.ArgumentParser(description="Match 3 Game - Modes & Challenges!")
+    parser.add_argument('--simulate', type=int, metavar='N', help="play N games with the bot without a window and print stats")
+    parser.add_argument('--mode', choices=['objective', 'endless'], default='endless', help="game mode for --simulate")
+    parser.add_argument('--max-moves', type=int, default=500, help="stop a simulated game after this many moves")
+    parser.add_argument('--seed', type=int, help="seed the random module")
+    parser.add_argument('--bot', choices=['greedy', 'expectimax'], default='greedy', help="bot for the bot buttons and --simulate")
+    parser.add_argument('--bot-time', type=float, default=BOT_TIME_BUDGET, help="seconds the expectimax bot searches per move")
+    parser.add_argument('--rollouts', type=int, default=BOT_ROLLOUTS, help="Monte Carlo rollouts per bot move (1 = the --bot bot)")
+    parser.add_argument('--workers', type=int, default=BOT_WORKERS, help="processes for the Monte Carlo bot and for --replay")
+    parser.add_argument('--size', type=int, default=grid_size, help="board width and height in tiles")
+    parser.add_argument('--tiles', type=int, default=len(tile_types), choices=range(3, len(TILE_NAMES)+1), help="number of tile colors")
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help="tile size in pixels")
+    parser.add_argument('--turbo', action='store_true', help=f"start with turbo autoplay on: no animations, at most {TURBO_FPS} redraws a second")
+    parser.add_argument('--record', metavar='FILE', help="write the replay log of the game (or of every simulated game) to FILE")
+    parser.add_argument('--replay', metavar='FILE', help="replay the logs in FILE without a window and check their scores")
+    parser.add_argument('--profile', metavar='FILE', help="time each phase and write the stats to FILE as JSON when the game ends (F3 shows them in the window)")
+    args = parser.parse_args()
+    if args.size < 3:
+        parser.error("--size must be at least 3")
+    if args.tile_size < MIN_TILE_SIZE:
+        parser.error(f"--tile-size must be at least {MIN_TILE_SIZE}")
+    if not TK_AVAILABLE and not (args.simulate or args.replay):
+        parser.error("the game window needs tkinter, which this Python lacks; --simulate and --replay work without it")
+    PROFILER.enabled = bool(args.profile)
+    if args.replay:
+        try:
+            ok = run_replay(args.replay, args.workers)
+        except (OSError, ValueError, struct.error) as e:
+            parser.error(f"cannot replay {args.replay}: {e}")
+        if args.profile:
+            PROFILER.dump(args.profile)
+        raise SystemExit(0 if ok else 1)
+    if args.seed is not None:
+        random.seed(args.seed)
+    tiles = TILE_NAMES[:args.tiles]
+    if args.rollouts > 1:
+        bot = MonteCarloBot(args.rollouts, args.workers, args.seed, tiles)
+    elif args.bot == 'expectimax':
+        bot = ExpectimaxBot(args.bot_time, tiles=tiles)
+    else:
+        bot = None
+    try:
+        if args.simulate:
+            run_simulation(args, bot)
+            return
+        root = tk.Tk()
+        root.title("Match 3 Game - Modes & Challenges!")
+        game = Match3Game(root, bot, args.size, tiles, args.tile_size, args.turbo)
+        root.mainloop()
+        game.bot_worker.close()
+        game.audio.close()
+        if args.record:
+            with open(args.record, 'wb') as f:
+                f.write(game.engine.replay_bytes())
+    finally:
+        if bot:
+            bot.close()
+        if args.profile:
+            PROFILER.dump(args.profile)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
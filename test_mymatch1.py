@@ -0,0 +1,256 @@
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import mymatch1 as game
+
+# Headless checks of the engine and the fast matchers: python -m pytest -q
+
+TILES = game.TILE_NAMES[:5]
+# Low targets, so a few moves are enough to level up and deal a new board
+QUICK_LEVELS = {'level_base_target': 40, 'level_target_increment': 40}
+
+def random_board(rng, h, w, specials=0.2):
+    # Any board, matches included; a fifth of the tiles are special
+    kinds = [game.STRIPED_H, game.STRIPED_V, game.COLOR_BOMB]
+    return [[(rng.choice(TILES), rng.choice(kinds)) if rng.random() < specials else rng.choice(TILES)
+             for _ in range(w)] for _ in range(h)]
+
+def brute_force_moves(board):
+    h, w = len(board), len(board[0])
+    return [move for move in game.candidate_moves(h, w) if game.swap_creates_match([row[:] for row in board], *move)]
+
+def play(engine, moves, rng):
+    # Plays greedy moves, with the odd undo and redo thrown in
+    bot = game.GreedyBot(tiles=engine.tiles)
+    for _ in range(moves):
+        if engine.game_over:
+            break
+        engine.play_move(*bot.choose_move(engine.board, engine.legal_moves(), engine.objective_color))
+        if rng.random() < 0.2:
+            engine.undo()
+            if rng.random() < 0.5:
+                engine.redo()
+
+@pytest.mark.parametrize('mode', game.game_modes)
+def test_replay_is_deterministic(mode):
+    rng = random.Random(1)
+    engines = []
+    for seed in range(4):
+        engine = game.Match3Engine(mode, 8, TILES, seed)
+        play(engine, 40, rng)
+        engines.append(engine)
+    logs = game.read_replays(b''.join(engine.replay_bytes() for engine in engines))
+    assert len(logs) == len(engines)
+    for engine, log in zip(engines, logs):
+        assert game.verify_replay(log)
+        assert game.replay_game(log).board == engine.board
+def test_replay_catches_a_wrong_score():
+    engine = game.Match3Engine("Endless Mode", 8, TILES, 11)
+    play(engine, 20, random.Random(2))
+    log, end = game.read_replay(engine.replay_bytes())
+    log.score += 1
+    assert not game.verify_replay(log)
+
+@pytest.mark.parametrize('size', [3, 5, 8, 13, 21])
+def test_bitboard_matches_list_matcher(size):
+    rng = random.Random(size)
+    for _ in range(100):
+        board = random_board(rng, size, size)
+        bits = game.BitBoard(board)
+        matches = game.find_matches_with_lengths(board)
+        # Same dict, in the same order
+        assert list(bits.find_matches().items()) == list(matches.items())
+        assert bits.legal_moves() == brute_force_moves(board)
+
+def test_bitboard_skips_color_bomb_runs():
+    board = game.create_stable_board(random.Random(1), 6, TILES)
+    for x in range(4):
+        board[2][x] = ('A', game.COLOR_BOMB)
+    assert game.BitBoard(board).find_matches() == game.find_matches_with_lengths(board) == {}
+
+
+@pytest.mark.skipif(not game.NUMPY_AVAILABLE, reason="needs numpy")
+@pytest.mark.parametrize('size', [3, 5, 8, 13])
+def test_numpy_match_lengths_equal_list_matcher(size):
+    rng = random.Random(size)
+    for _ in range(200):
+        board = random_board(rng, size, size)
+        lengths = game.match_lengths_np(game.encode_colors(board))
+        found = {(x, y): int(lengths[y, x]) for y, x in zip(*lengths.nonzero())}
+        assert found == game.find_matches_with_lengths(board)
+
+@pytest.mark.skipif(not game.NUMPY_AVAILABLE, reason="needs numpy")
+def test_numpy_drop_equals_list_drop():
+    rng = random.Random(3)
+    for _ in range(200):
+        board = random_board(rng, 8, 8)
+        game.clear_matches(board, game.find_matches_with_lengths(board))
+        colors = game.encode_colors(board)
+        game.drop_tiles(board)
+        game.drop_tiles_np(colors)
+        assert (colors == game.encode_colors(board)).all()
+
+@pytest.mark.skipif(not game.NUMPY_AVAILABLE, reason="needs numpy")
+@pytest.mark.parametrize('size', [8, 20])
+def test_numpy_move_scores_include_the_swap_match(size):
+    # Refills are random, so the cascade varies, but its first step is the swap's own
+    # matches; boards bigger than BOT_WINDOW are scored on a window around the swap
+    rng = random.Random(size)
+    random.seed(size)
+    for _ in range(10):
+        board = game.create_stable_board(rng, size, TILES)
+        moves = game.legal_moves(board)
+        scores = game.score_moves_np(game.encode_colors(board), moves, TILES)
+        for move, score in zip(moves, scores.tolist()):
+            swapped = [row[:] for row in board]
+            game.swap_cells(swapped, *move)
+            matches = game.find_matches_after_swap(swapped, *move)
+            assert score >= sum(min(length - 2, 3) for length in matches.values()) > 0
+
+@pytest.mark.parametrize('size', [3, 8, 12])
+def test_move_index_follows_edits(size):
+    # A few cells at a time (special kinds too), then most of the board at once
+    rng = random.Random(size)
+    board = random_board(rng, size, size)
+    index = game.MoveIndex(board)
+    assert index.ordered() == brute_force_moves(board)
+    for step in range(150):
+        edits = size*size // 2 if step % 25 == 0 else rng.randint(1, 3)
+        for _ in range(edits):
+            x, y = rng.randrange(size), rng.randrange(size)
+            board[y][x] = random_board(rng, 1, 1, specials=0.5)[0][0]
+        index.sync(board)
+        assert index.ordered() == brute_force_moves(board)
+        assert index.hint() == (index.ordered() or [None])[0]
+
+def test_engine_legal_moves_stay_exact_in_play():
+    engine = game.Match3Engine("Endless Mode", 8, TILES, 5)
+    rng = random.Random(5)
+    for _ in range(40):
+        moves = engine.legal_moves()
+        assert moves == brute_force_moves(engine.board)
+        if engine.game_over:
+            break
+        engine.play_move(*rng.choice(moves))
+
+def test_engine_runs_without_tkinter():
+    # Servers often have a Python built without Tk: only the window may need it
+    code = ("import sys; sys.modules['tkinter'] = None; import mymatch1 as game; "
+            "assert not game.TK_AVAILABLE; print(game.simulate_games(1, max_moves=5, size=6))")
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+@pytest.mark.parametrize('size', [3, 4, 8, 16])
+@pytest.mark.parametrize('colors', [3, 5, 8])
+def test_stable_board_has_a_move_and_no_matches(size, colors):
+    rng = random.Random(size*10 + colors)
+    tiles = game.TILE_NAMES[:colors]
+    for _ in range(100):
+        board = game.create_stable_board(rng, size, tiles)
+        assert all(tile in tiles for row in board for tile in row)
+        assert game.find_matches_with_lengths(board) == {}
+        assert game.legal_moves(board)
+
+def test_plant_move_unlocks_a_deadlocked_board():
+    # The repeating diagonal has no match and no legal swap
+    for size in [3, 5, 8]:
+        board = [[TILES[(x + 2*y) % 4] for x in range(size)] for y in range(size)]
+        assert not game.legal_moves(board)
+        game.plant_move(board, random.Random(size), TILES)
+        assert game.find_matches_with_lengths(board) == {}
+        assert game.legal_moves(board)
+
+def env_board(colors):
+    return [[game.TILE_NAMES[c] for c in row] for row in colors.tolist()]
+
+@pytest.mark.skipif(not game.NUMPY_AVAILABLE, reason="needs numpy")
+@pytest.mark.parametrize('size', [3, 8, 11])
+def test_batch_env_legal_mask_equals_legal_moves(size):
+    env = game.BatchEnv(32, size, TILES, seed=size)
+    moves = game.candidate_moves(size, size)
+    rng = random.Random(size)
+    for _ in range(20):
+        for colors, legal in zip(env.colors, env.legal):
+            board = env_board(colors)
+            assert game.find_matches_with_lengths(board) == {}
+            assert [move for move, ok in zip(moves, legal) if ok] == game.legal_moves(board)
+        # reset() keeps every board playable, so every legal action scores
+        actions = [rng.choice(legal.nonzero()[0].tolist()) for legal in env.legal]
+        colors, rewards, done, legal = env.step(actions)
+        assert (rewards > 0).all()
+        env.reset(done)
+    # An action that makes no match leaves the board alone and scores nothing
+    before = env.colors.copy()
+    colors, rewards, done, legal = env.step(env.legal.argmin(axis=1))
+    assert (rewards == 0).all() and (colors == before).all()
+
+def test_undo_redo_round_trip():
+    engine = game.Match3Engine("Objective Mode", 8, TILES, 7, QUICK_LEVELS)
+    bot = game.GreedyBot(tiles=TILES)
+    states = [([row[:] for row in engine.board], engine.progress())]
+    while len(states) <= 30 and not engine.game_over:
+        assert engine.play_move(*bot.choose_move(engine.board, engine.legal_moves(), engine.objective_color))
+        states.append(([row[:] for row in engine.board], engine.progress()))
+    # Level-ups keep whole boards, the other moves only the cells they changed
+    assert engine.level > 2
+    assert any(boards for cells, boards, before, after in engine.history)
+    assert any(cells for cells, boards, before, after in engine.history)
+    for board, progress in reversed(states[:-1]):
+        assert engine.undo()
+        assert (engine.board, engine.progress()) == (board, progress)
+    assert not engine.undo()
+    for board, progress in states[1:]:
+        assert engine.redo()
+        assert (engine.board, engine.progress()) == (board, progress)
+    assert not engine.redo()
+
+def test_undo_keeps_snapshots_apart():
+    # Writing to the board after an undo or redo must not reach the stored boards
+    engine = game.Match3Engine("Endless Mode", 8, TILES, 3, QUICK_LEVELS)
+    bot = game.GreedyBot(tiles=TILES)
+    while engine.level == 1:
+        engine.play_move(*bot.choose_move(engine.board, engine.legal_moves(), engine.objective_color))
+    after = [row[:] for row in engine.board]
+    game.writable_row(engine.board, 0)[0] = None
+    assert engine.undo()
+    before = [row[:] for row in engine.board]
+    game.writable_row(engine.board, 0)[0] = None
+    assert engine.redo()
+    assert engine.board == after
+    assert engine.undo()
+    assert engine.board == before
+
+def test_snapshot_shares_rows_until_written():
+    board = game.CowBoard([['A', 'B', 'C'], ['C', 'A', 'B'], ['B', 'C', 'A']])
+    copy = board.snapshot()
+    assert all(a is b for a, b in zip(board, copy))
+    game.writable_row(board, 1)[0] = 'B'
+    assert copy[1][0] == 'C' and board[1][0] == 'B'
+    assert board[0] is copy[0] and board[1] is not copy[1]
+def test_audio_worker_merges_and_drops_a_burst():
+    # The backend holds the first sound until released, so the rest pile up behind it
+    started, release, heard = threading.Event(), threading.Event(), []
+    def backend(freq, duration):
+        heard.append(freq)
+        started.set()
+        release.wait(5)
+    audio = game.AudioWorker(backend, maxsize=2)
+    audio.play(100, 50)
+    assert started.wait(5)
+    for freq in [200, 200, 300, 400, 200]:
+        audio.play(freq, 50)
+    assert (audio.merged, audio.dropped) == (2, 1)
+    release.set()
+    deadline = time.time() + 5
+    while audio.played < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    audio.close()
+    audio.thread.join(5)
+    assert not audio.thread.is_alive()
+    assert heard == [100, 200, 300] and audio.played == 3
\ No newline at end of file
@@ -0,0 +1,39 @@
+import pytest
+
+import mymatch1 as game
+import tournament
+
+# Checks of the tournament's parsing and statistics: python -m pytest -q
+
+TILES = game.TILE_NAMES[:5]
+
+def test_parse_strategy():
+    assert tournament.parse_strategy('greedy') == ('greedy', {})
+    assert tournament.parse_strategy('expectimax:level_base_target=50,objective_per_level=3') == \
+        ('expectimax', {'level_base_target': 50, 'objective_per_level': 3})
+
+@pytest.mark.parametrize('spec', ['random', 'greedy:speed=3', 'greedy:level_base_target', 'greedy:level_base_target=high'])
+def test_parse_strategy_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        tournament.parse_strategy(spec)
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 11))
+    assert [tournament.percentile(values, q) for q in [0, 10, 15, 50, 90, 95, 100]] == [1, 1, 2, 5, 9, 10, 10]
+    assert tournament.percentile([7], 99) == 7
+    assert tournament.percentile([], 50) is None
+
+class RefusedBot:
+    # Picks a swap that makes no match, which the engine refuses
+    def choose_move(self, board, moves, objective_color):
+        return next(move for move in game.candidate_moves(len(board), len(board[0])) if move not in moves)
+
+def test_illegal_moves_are_counted_apart_from_deadlocks():
+    engine = game.Match3Engine("Endless Mode", 8, TILES, 1)
+    stats, think = tournament.play_game(engine, RefusedBot(), 50)
+    assert (stats['outcome'], stats['moves'], len(think)) == ('illegal_move', 0, 1)
+    bot = game.GreedyBot(tiles=TILES)
+    games = [stats] + [tournament.play_game(game.Match3Engine("Endless Mode", 8, TILES, seed), bot, 5)[0] for seed in range(3)]
+    summary = tournament.summarize('mixed', games, think)
+    assert summary['illegal_move_rate'] == 0.25
+    assert summary['deadlock_rate'] + summary['max_moves_rate'] == 0.75
\ No newline at end of file
@@ -0,0 +1,235 @@
+import argparse
+import csv
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+
+import mymatch1 as game
+
+# Plays seeded games with several bot strategies and compares them.
+#   python tournament.py --games 1000 --strategies greedy expectimax --output results.json
+#   python tournament.py --strategies greedy greedy:level_target_increment=40 --csv games.csv
+# A strategy is a bot name, optionally followed by ':' and balance overrides as
+# key=value pairs separated by commas (keys from game.BALANCE). Game i of every
+# strategy uses the same seed, so all strategies start from the same boards.
+
+BOTS = ['greedy', 'expectimax']
+DEFAULT_GAMES = 200
+DEFAULT_SEED = 1234
+CHUNK_GAMES = 10  # games a worker plays per task
+SCORE_PERCENTILES = [10, 50, 90]
+THINK_PERCENTILES = [50, 95, 99]
+GAME_FIELDS = ['strategy', 'game', 'seed', 'score', 'level', 'score_levels', 'objectives', 'moves', 'outcome', 'think_ms_mean', 'think_ms_max']
+# How a game ended: no legal swap left, the move limit, or the bot picked a swap the
+# engine refused (a bot or engine bug, kept out of the deadlock stats)
+OUTCOMES = ['deadlock', 'max_moves', 'illegal_move']
+
+def parse_strategy(spec):
+    # 'greedy:level_base_target=50,objective_per_level=3' -> ('greedy', {...})
+    bot, _, overrides = spec.partition(':')
+    if bot not in BOTS:
+        raise ValueError(f"unknown bot {bot!r} (choose from {', '.join(BOTS)})")
+    balance = {}
+    for item in filter(None, overrides.split(',')):
+        key, sep, value = item.partition('=')
+        if not sep or key not in game.BALANCE:
+            raise ValueError(f"bad balance setting {item!r} (keys: {', '.join(game.BALANCE)})")
+        balance[key] = int(value)
+    return bot, balance
+
+def make_bot(name, tiles, bot_time):
+    if name == 'expectimax':
+        return game.ExpectimaxBot(bot_time, tiles=tiles)
+    return game.GreedyBot(tiles=tiles)
+
+def play_game(engine, bot, max_moves):
+    # Plays until the board deadlocks or max_moves moves. Returns the game's stats and
+    # the bot's think time for every move.
+    moves = 0
+    think = []
+    outcome = None
+    while not engine.game_over and moves < max_moves:
+        start = time.perf_counter()
+        move = bot.choose_move(engine.board, engine.legal_moves(), engine.objective_color)
+        think.append(time.perf_counter() - start)
+        if move is None or not engine.play_move(*move):
+            outcome = 'illegal_move'
+            break
+        moves += 1
+    if outcome is None:
+        outcome = 'deadlock' if engine.game_over else 'max_moves'
+    stats = {
+        'score': engine.score,
+        'level': engine.level,
+        # Level-ups from reaching the target score; the others came from objectives
+        'score_levels': engine.level - 1 - engine.objectives_completed,
+        'objectives': engine.objectives_completed,
+        'moves': moves,
+        'outcome': outcome,
+        'think_ms_mean': 1000 * sum(think) / len(think) if think else 0.0,
+        'think_ms_max': 1000 * max(think, default=0.0),
+    }
+    return stats, think
+
+def play_chunk(task):
+    # Runs in a worker process. Every game gets a new bot and a seeded random module,
+    # so a game plays the same whatever chunk or worker it lands in (the expectimax bot
+    # still depends on its time budget).
+    spec, first, seeds, mode, size, tiles, max_moves, bot_time = task
+    name, balance = parse_strategy(spec)
+    games = []
+    think = []
+    for i, seed in enumerate(seeds, first):
+        random.seed(seed)
+        bot = make_bot(name, tiles, bot_time)
+        try:
+            stats, times = play_game(game.Match3Engine(mode, size, tiles, seed, balance), bot, max_moves)
+        finally:
+            bot.close()
+        stats.update(strategy=spec, game=i, seed=seed)
+        games.append(stats)
+        think.extend(times)
+    return spec, games, think
+
+def run_tournament(strategies, games, seed, mode, size, tiles, max_moves, bot_time, workers):
+    # Returns {strategy: (games, think times)}, the games in seed order
+    rng = random.Random(seed)
+    seeds = [rng.getrandbits(64) for _ in range(games)]
+    tasks = [(spec, i, seeds[i:i+CHUNK_GAMES], mode, size, tiles, max_moves, bot_time)
+             for spec in strategies for i in range(0, games, CHUNK_GAMES)]
+    results = {spec: ([], []) for spec in strategies}
+    pool = multiprocessing.Pool(workers) if workers > 1 and len(tasks) > 1 else None
+    try:
+        chunks = pool.imap_unordered(play_chunk, tasks) if pool else map(play_chunk, tasks)
+        for done, (spec, chunk_games, think) in enumerate(chunks, 1):
+            results[spec][0].extend(chunk_games)
+            results[spec][1].extend(think)
+            print(f"\r{done}/{len(tasks)} chunks", end='', file=sys.stderr)
+        print(file=sys.stderr)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    for chunk_games, _ in results.values():
+        chunk_games.sort(key=lambda g: g['game'])
+    return results
+
+def percentile(values, q):
+    # Nearest-rank percentile of a sorted list
+    if not values:
+        return None
+    return values[min(len(values), max(1, math.ceil(q / 100 * len(values)))) - 1]
+
+def mean(values):
+    return sum(values) / len(values) if values else None
+
+def summarize(spec, games, think):
+    scores = sorted(g['score'] for g in games)
+    deadlocks = [g['moves'] for g in games if g['outcome'] == 'deadlock']
+    think_ms = sorted(1000 * t for t in think)
+    summary = {
+        'strategy': spec,
+        'games': len(games),
+        'score_mean': mean(scores),
+    }
+    for q in SCORE_PERCENTILES:
+        summary[f'score_p{q}'] = percentile(scores, q)
+    summary.update({
+        'level_mean': mean([g['level'] for g in games]),
+        'level_max': max((g['level'] for g in games), default=None),
+        'score_levels_mean': mean([g['score_levels'] for g in games]),
+        'objectives_mean': mean([g['objectives'] for g in games]),
+        'moves_mean': mean([g['moves'] for g in games]),
+    })
+    for outcome in OUTCOMES:
+        summary[f'{outcome}_rate'] = sum(g['outcome'] == outcome for g in games) / len(games) if games else None
+    summary.update({
+        'moves_to_deadlock_mean': mean(deadlocks),
+        'think_ms_mean': mean(think_ms),
+    })
+    for q in THINK_PERCENTILES:
+        summary[f'think_ms_p{q}'] = percentile(think_ms, q)
+    summary['think_ms_max'] = think_ms[-1] if think_ms else None
+    return summary
+
+def print_summary(summary):
+    def fmt(value, spec):
+        return 'n/a' if value is None else format(value, spec)
+    print(f"{summary['strategy']}: {summary['games']} games", file=sys.stderr)
+    print(f"  score      mean {fmt(summary['score_mean'], '.1f')}  " + "  ".join(f"p{q} {summary[f'score_p{q}']}" for q in SCORE_PERCENTILES), file=sys.stderr)
+    print(f"  level      mean {fmt(summary['level_mean'], '.2f')}  max {summary['level_max']}  from score mean {fmt(summary['score_levels_mean'], '.2f')}  from objectives mean {fmt(summary['objectives_mean'], '.2f')}", file=sys.stderr)
+    print(f"  moves      mean {fmt(summary['moves_mean'], '.1f')}  deadlocked {fmt(summary['deadlock_rate'], '.0%')}  moves to deadlock mean {fmt(summary['moves_to_deadlock_mean'], '.1f')}", file=sys.stderr)
+    if summary['illegal_move_rate']:
+        print(f"  ILLEGAL MOVES in {fmt(summary['illegal_move_rate'], '.0%')} of games: the bot chose a swap the engine refused", file=sys.stderr)
+    print(f"  think ms   mean {fmt(summary['think_ms_mean'], '.2f')}  " + "  ".join(f"p{q} {fmt(summary[f'think_ms_p{q}'], '.2f')}" for q in THINK_PERCENTILES) + f"  max {fmt(summary['think_ms_max'], '.2f')}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare match 3 bot strategies and balance settings over many seeded games")
+    parser.add_argument('--strategies', nargs='+', default=['greedy'], help="bot[:key=value,...] for each strategy; keys: " + ", ".join(game.BALANCE))
+    parser.add_argument('--games', type=int, default=DEFAULT_GAMES, help="games per strategy")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="seed for the game seeds")
+    parser.add_argument('--mode', choices=['objective', 'endless'], default='objective', help="game mode")
+    parser.add_argument('--size', type=int, default=game.grid_size, help="board width and height in tiles")
+    parser.add_argument('--tiles', type=int, default=len(game.tile_types), choices=range(3, len(game.TILE_NAMES)+1), help="number of tile colors")
+    parser.add_argument('--max-moves', type=int, default=500, help="stop a game after this many moves")
+    parser.add_argument('--bot-time', type=float, default=game.BOT_TIME_BUDGET, help="seconds the expectimax bot searches per move")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="processes to play the games on")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--csv', metavar='FILE', help="write one row per game to FILE")
+    args = parser.parse_args()
+    if args.size < 3:
+        parser.error("--size must be at least 3")
+    if args.games < 1:
+        parser.error("--games must be at least 1")
+    for spec in args.strategies:
+        try:
+            parse_strategy(spec)
+        except ValueError as e:
+            parser.error(str(e))
+    mode = "Objective Mode" if args.mode == "objective" else "Endless Mode"
+    tiles = game.TILE_NAMES[:args.tiles]
+    start = time.perf_counter()
+    results = run_tournament(args.strategies, args.games, args.seed, mode, args.size, tiles, args.max_moves, args.bot_time, args.workers)
+    elapsed = time.perf_counter() - start
+    total = args.games * len(args.strategies)
+    print(f"{total} games ({mode}, {args.size}x{args.size}, {args.tiles} tiles) in {elapsed:.2f}s: {total/elapsed:.2f} games/s", file=sys.stderr)
+    summaries = [summarize(spec, *results[spec]) for spec in args.strategies]
+    for summary in summaries:
+        print_summary(summary)
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'games': args.games,
+            'mode': mode,
+            'size': args.size,
+            'tiles': tiles,
+            'max_moves': args.max_moves,
+            'bot_time': args.bot_time,
+            'workers': args.workers,
+            'seconds': elapsed,
+            'balance': game.BALANCE,
+        },
+        'strategies': summaries,
+        'games': [g for spec in args.strategies for g in results[spec][0]],
+    }
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, GAME_FIELDS)
+            writer.writeheader()
+            writer.writerows(report['games'])
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file